@@ -0,0 +1,98 @@
+# benchmarks/bench_content.py
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from urllib.parse import unquote
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from scraper.step_4_render import list_attachment_files, transform_post_content
+
+
+def transform_post_content_old(content):
+    """The previous rewrite with a per-call pattern and lambda, kept here as the baseline."""
+    content = content.replace('\n', '<br>\n')
+    jump_to_pattern = r'href="jump-to\.php\?url=([^"]+)"'
+    return re.sub(jump_to_pattern, lambda m: f'href="{unquote(m.group(1))}"', content)
+
+
+def make_content(target_size, rng):
+    """Builds post content of roughly target_size characters with links, paragraphs and line breaks."""
+    pieces = [
+        "北大未名BBS的帖子正文通常是中文段落，",
+        "夹杂一些 English words and numbers 12345。",
+        "\n",
+        '<a href="jump-to.php?url=https%3A%2F%2Fwww.example.com%2Fpath%3Fq%3D%25E4%25B8%25AD%26page%3D2">链接</a>',
+        "<p>一个新的段落</p>\n",
+    ]
+    weights = [40, 30, 15, 5, 10]
+    parts = []
+    size = 0
+    while size < target_size:
+        piece = rng.choices(pieces, weights)[0]
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)
+
+
+def bench_transform(label, contents, repeat):
+    results = {}
+    for name, func in (("old", transform_post_content_old), ("new", transform_post_content)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for content in contents:
+                func(content)
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed
+        posts_per_second = len(contents) * repeat / elapsed
+        print(f"{label:<8} {name:<12} {posts_per_second:12.0f} posts/s")
+
+    for content in contents:
+        assert transform_post_content_old(content) == transform_post_content(content)
+    print(f"{label:<8} {'speedup':<12} {results['old'] / results['new']:12.2f}x")
+
+
+def bench_attachment_lookup(num_files, repeat):
+    with tempfile.TemporaryDirectory() as board_path:
+        attachment_dir = os.path.join(board_path, config.ATTACHMENT_DIR_NAME, "1")
+        os.makedirs(attachment_dir)
+        filenames = [f"{i}.jpg" for i in range(num_files)]
+        for filename in filenames[::2]:  # Half of the attachments were downloaded.
+            open(os.path.join(attachment_dir, filename), "wb").close()
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            [os.path.exists(os.path.join(attachment_dir, filename)) for filename in filenames]
+        per_exists = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            local_files = list_attachment_files(board_path, "1")
+            [filename in local_files for filename in filenames]
+        per_scandir = (time.perf_counter() - started) / repeat
+
+    print(f"{num_files} attachments: os.path.exists {per_exists * 1e6:9.1f} us/thread, "
+          f"one scandir {per_scandir * 1e6:9.1f} us/thread")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark of the step 4 post content rewrite.")
+    parser.add_argument("--posts", type=int, default=2000, help="Posts per size class.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for label, size in (("500 B", 500), ("5 KB", 5_000), ("50 KB", 50_000)):
+        contents = [make_content(size, rng) for _ in range(max(1, args.posts * 500 // size))]
+        bench_transform(label, contents, args.repeat)
+
+    for num_files in (1, 10, 100):
+        bench_attachment_lookup(num_files, args.repeat * 100)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
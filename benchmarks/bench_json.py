@@ -0,0 +1,96 @@
+# benchmarks/bench_json.py
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.fixtures import make_thread_data
+from scraper import serialization
+
+
+def load_threads(json_dir, limit):
+    names = sorted(name for name in os.listdir(json_dir) if name.endswith(".json"))[:limit or None]
+    threads = []
+    for name in names:
+        with open(os.path.join(json_dir, name), "r", encoding="utf-8") as f:
+            threads.append(json.load(f))
+    return threads
+
+
+def write_stdlib_indented(path, thread_data):
+    """The previous write path: json.dump with indent=4 straight into the final file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(thread_data, f, ensure_ascii=False, indent=4)
+
+
+def read_stdlib(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def directory_size(path):
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.name.endswith(".json"))
+
+
+def timed(label, func, paths, baseline=None):
+    started = time.perf_counter()
+    for path in paths:
+        func(path)
+    elapsed = time.perf_counter() - started
+    comparison = f"{baseline / elapsed:6.2f}x" if baseline else ""
+    print(f"{label:<44} {elapsed:8.2f} s {len(paths) / elapsed:10.0f} threads/s {comparison}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reading and writing thread JSON files.")
+    parser.add_argument("--board_dir", type=str,
+                        help="A scraped board folder (output/<board id>); its jsons/ are copied and used.")
+    parser.add_argument("--threads", type=int, default=5000,
+                        help="Synthetic threads to generate without --board_dir, or a cap on the real ones.")
+    parser.add_argument("--posts", type=int, default=30, help="Posts per synthetic thread.")
+    args = parser.parse_args()
+
+    if args.board_dir:
+        threads = load_threads(os.path.join(args.board_dir, "jsons"), args.threads)
+        print(f"Loaded {len(threads)} threads from {args.board_dir}")
+    else:
+        threads = [make_thread_data(i, args.posts) for i in range(1, args.threads + 1)]
+        print(f"Generated {len(threads)} synthetic threads with {args.posts} posts each")
+    print(f"orjson: {'installed' if serialization.orjson else 'not installed'}")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_json_")
+    try:
+        results = {}
+        for layout in ("indented", "compact"):
+            layout_dir = os.path.join(work_dir, layout)
+            os.makedirs(layout_dir)
+            paths = [os.path.join(layout_dir, f"{thread['id']}.json") for thread in threads]
+            by_path = dict(zip(paths, threads))
+
+            if layout == "indented":
+                results["write"] = timed("write: json.dump indent=4 (previous)",
+                                         lambda path: write_stdlib_indented(path, by_path[path]), paths)
+            timed(f"write: serialization {layout}, atomic",
+                  lambda path: serialization.dump_file(path, by_path[path], compact=layout == "compact"),
+                  paths, results["write"])
+
+            if layout == "indented":
+                results["read"] = timed("read:  json.load (previous)", read_stdlib, paths)
+            timed(f"read:  serialization.load_file {layout}", serialization.load_file, paths, results["read"])
+            results[f"size_{layout}"] = directory_size(layout_dir)
+
+        print(f"Disk use: {results['size_indented'] / 1e6:.1f} MB indented, "
+              f"{results['size_compact'] / 1e6:.1f} MB compact "
+              f"({1 - results['size_compact'] / results['size_indented']:.0%} smaller)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# benchmarks/bench_parsers.py
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from benchmarks.fixtures import make_thread_page_html
+from scraper.step_2_thread import parse_post
+from scraper.utils import is_html_parser_available, make_soup
+
+PARSERS = ("html.parser", "lxml", "html5lib")
+
+
+def parse_pages(pages, parser):
+    """Parses every page and every post card the way crawl_thread does."""
+    posts = []
+    for html in pages:
+        soup = make_soup(html, parser)
+        for post_element in soup.select("div.post-card"):
+            posts.append(parse_post(post_element, config.BASE_URL, len(posts) + 1))
+    return posts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare posts/sec of the available HTML parser backends.")
+    parser.add_argument("--pages", type=int, default=20, help="Number of thread pages to parse.")
+    parser.add_argument("--posts_per_page", type=int, default=30, help="Post cards per page.")
+    parser.add_argument("--inline_images", type=int, default=0, help="Base64 inline images per post.")
+    args = parser.parse_args()
+
+    pages = [
+        make_thread_page_html(i, posts_per_page=args.posts_per_page, inline_images=args.inline_images)
+        for i in range(1, args.pages + 1)
+    ]
+    num_posts = args.pages * args.posts_per_page
+    megabytes = sum(len(html.encode("utf-8")) for html in pages) / 1e6
+    print(f"Parsing {args.pages} pages, {num_posts} posts, {megabytes:.1f} MB of HTML")
+
+    reference = None
+    for name in PARSERS:
+        if not is_html_parser_available(name):
+            print(f"{name:<12} not installed")
+            continue
+
+        started = time.perf_counter()
+        posts = parse_pages(pages, name)
+        elapsed = time.perf_counter() - started
+
+        if reference is None:
+            reference = posts
+            note = "reference"
+        else:
+            mismatches = sum(a != b for a, b in zip(reference, posts)) + abs(len(reference) - len(posts))
+            note = "identical results" if not mismatches else f"{mismatches} posts differ from html.parser"
+        print(f"{name:<12} {num_posts / elapsed:10.0f} posts/s  {megabytes / elapsed:6.2f} MB/s  ({note})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
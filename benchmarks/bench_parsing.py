@@ -0,0 +1,154 @@
+# benchmarks/bench_parsing.py
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from benchmarks.fixtures import make_index_page_html, make_thread_page_html
+from scraper.step_1_index import get_board_name, parse_index_page
+from scraper.step_2_thread import extract_inline_images, is_thread_page_complete, parse_post
+from scraper.utils import get_html_parser, make_soup
+
+# Saved real pages can be dropped here as thread_*.html / index_*.html to be benchmarked as well.
+SAVED_PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+
+
+def build_fixtures():
+    """Returns {name: (kind, html)} for the synthetic pages plus any saved ones."""
+    fixtures = {
+        "thread_typical": ("thread", make_thread_page_html(1001, posts_per_page=30)),
+        "thread_huge_page": ("thread", make_thread_page_html(1002, posts_per_page=500, paragraphs=6)),
+        "thread_many_quotes": ("thread", make_thread_page_html(1003, posts_per_page=30, quotes=10)),
+        "thread_inline_images": (
+            "thread",
+            make_thread_page_html(1004, posts_per_page=10, inline_images=2, inline_image_bytes=1_000_000),
+        ),
+        "index_typical": ("index", make_index_page_html(page=1, total_pages=100, threads_per_page=30)),
+    }
+    for path in sorted(glob.glob(os.path.join(SAVED_PAGES_DIR, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        kind = "index" if name.startswith("index") else "thread"
+        with open(path, "r", encoding="utf-8") as f:
+            fixtures[f"saved_{name}"] = (kind, f.read())
+    return fixtures
+
+
+def expected_thread_id(soup):
+    link = soup.select_one("link[rel=alternate]")
+    href = link.get("href", "") if link else ""
+    return href.rsplit("threadid=", 1)[-1] if "threadid=" in href else None
+
+
+def thread_cases(html):
+    """Yields (function, setup, run, units) for one thread page. setup returns a fresh input per repetition."""
+    yield "make_soup", lambda: html, make_soup, 1
+
+    soup = make_soup(html)
+    num_cards = len(soup.select("div.post-card"))
+    thread_id = expected_thread_id(soup)
+    yield "is_thread_page_complete", lambda: soup, lambda s: is_thread_page_complete(s, thread_id), 1
+
+    # parse_post and extract_inline_images modify the tree, so they get a freshly parsed page every time.
+    def parse_all_posts(fresh_soup):
+        for index, post_element in enumerate(fresh_soup.select("div.post-card"), start=1):
+            parse_post(post_element, config.BASE_URL, index)
+
+    yield "parse_post", lambda: make_soup(html), parse_all_posts, num_cards
+
+    def extract_all_images(fresh_soup):
+        for index, body in enumerate(fresh_soup.select("div.post-card div.content div.body"), start=1):
+            extract_inline_images(body, index)
+
+    yield "extract_inline_images", lambda: make_soup(html), extract_all_images, num_cards
+
+
+def index_cases(html):
+    yield "make_soup", lambda: html, make_soup, 1
+
+    soup = make_soup(html)
+    num_items = len(soup.select("div.list-item-topic"))
+    yield "get_board_name", lambda: soup, get_board_name, 1
+    yield "parse_index_page", lambda: soup, lambda s: parse_index_page(s, 1), num_items
+
+
+def measure(setup, run, repeat):
+    """Returns (best seconds per call, peak traced memory in bytes)."""
+    best = float("inf")
+    for _ in range(repeat):
+        value = setup()
+        started = time.perf_counter()
+        run(value)
+        best = min(best, time.perf_counter() - started)
+
+    # Memory is measured in a separate run, as tracing slows everything down.
+    value = setup()
+    tracemalloc.start()
+    run(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTML parsing hot paths on offline fixtures.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per case; the best time is reported.")
+    parser.add_argument("--only", type=str, help="Only run fixtures whose name contains this string.")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=str, help="Compare against results saved earlier with --output.")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    print(f"HTML parser: {get_html_parser()}")
+    print(f"{'case':<50} {'ms/call':>10} {'units/s':>12} {'peak MB':>9} {'vs base':>8}")
+
+    results = {}
+    for fixture_name, (kind, html) in build_fixtures().items():
+        if args.only and args.only not in fixture_name:
+            continue
+        cases = thread_cases(html) if kind == "thread" else index_cases(html)
+        for function_name, setup, run, units in cases:
+            seconds, peak = measure(setup, run, args.repeat)
+            key = f"{fixture_name}/{function_name}"
+            results[key] = {
+                "seconds_per_call": seconds,
+                "units_per_second": units / seconds if seconds else None,
+                "peak_bytes": peak,
+                "html_bytes": len(html.encode("utf-8")),
+            }
+
+            comparison = ""
+            if key in baseline:
+                comparison = f"{baseline[key]['seconds_per_call'] / seconds:7.2f}x"
+            print(f"{key:<50} {seconds * 1000:10.2f} {units / seconds:12.0f} {peak / 1e6:9.1f} {comparison:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"commit": current_commit(), "html_parser": get_html_parser(), "results": results},
+                f,
+                indent=4,
+            )
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
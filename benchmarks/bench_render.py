@@ -0,0 +1,85 @@
+# benchmarks/bench_render.py
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from benchmarks.fixtures import make_thread_data
+from scraper.step_4_render import Renderer
+
+
+def render_per_thread_environment(threads, board_name):
+    """The old approach: a fresh environment and template compile for every thread."""
+    templates_dir = getattr(config, "TEMPLATES_DIR", "templates")
+    for thread_data in threads:
+        env = Environment(loader=FileSystemLoader(templates_dir))
+        template = env.get_template("thread.html")
+        template.render(thread=thread_data, config=config, board_name=board_name)
+
+
+def render_shared_renderer(threads, board_name, renderer):
+    for thread_data in threads:
+        renderer.thread_template.render(thread=thread_data, config=config, board_name=board_name)
+
+
+def timed(label, func, num_threads):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed:8.2f} s  {elapsed / num_threads * 1000:8.3f} ms/thread")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark per-thread template rendering on a synthetic board."
+    )
+    parser.add_argument("--threads", type=int, default=50000, help="Number of synthetic threads.")
+    parser.add_argument("--posts", type=int, default=10, help="Posts per synthetic thread.")
+    parser.add_argument(
+        "--before_sample",
+        type=int,
+        default=1000,
+        help="Only time the old approach on this many threads, as it is slow. 0 uses all threads.",
+    )
+    args = parser.parse_args()
+
+    print(f"Building {args.threads} synthetic threads with {args.posts} posts each...")
+    threads = [make_thread_data(i, args.posts) for i in range(1, args.threads + 1)]
+    board_name = "Benchmark"
+
+    sample = threads[:args.before_sample] if args.before_sample else threads
+    before = timed(
+        f"fresh Environment per thread (n={len(sample)})",
+        lambda: render_per_thread_environment(copy.deepcopy(sample), board_name),
+        len(sample),
+    ) / len(sample)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        setup_started = time.perf_counter()
+        Renderer(cache_dir=cache_dir)
+        cold_setup = time.perf_counter() - setup_started
+
+        setup_started = time.perf_counter()
+        warm_renderer = Renderer(cache_dir=cache_dir)
+        warm_setup = time.perf_counter() - setup_started
+
+        after = timed(
+            f"shared Renderer (n={len(threads)})",
+            lambda: render_shared_renderer(copy.deepcopy(threads), board_name, warm_renderer),
+            len(threads),
+        ) / len(threads)
+
+    print(f"Renderer setup: {cold_setup * 1000:.1f} ms cold, {warm_setup * 1000:.1f} ms with bytecode cache")
+    print(f"Speedup per thread: {before / after:.1f}x "
+          f"(estimated {before * len(threads):.0f} s -> {after * len(threads):.0f} s for the whole board)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# benchmarks/e2e.py
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from benchmarks.mock_bbs import MOCK_PASSWORD, MOCK_USERNAME, add_server_arguments, make_bbs, start_server
+from scraper.storage import open_thread_store
+from scraper.utils import make_soup
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def point_config_at(base_url, output_dir):
+    """Redirects the scraper to the mock server and a scratch output directory.
+
+    This has to run before the step modules are imported, as some of them read config at import time.
+    """
+    config.BASE_URL = base_url
+    config.BBS_LOGIN_URL = f"{base_url}login.php"
+    config.BBS_LOGIN_API_URL = f"{base_url}ajax/login.php"
+    config.BBS_COOKIE_FILE = os.path.join(output_dir, ".bbs_cookies")
+    config.OUTPUT_DIR = output_dir
+    config.TEMPLATES_DIR = os.path.join(REPO_DIR, getattr(config, "TEMPLATES_DIR", "templates"))
+    # Keep the retry back-off short, so injected faults don't turn into minutes of sleeping.
+    config.THREAD_PAGE_RETRY_DELAYS = (0, 0.5, 1, 2)
+    os.environ["BBS_USERNAME"] = MOCK_USERNAME
+    os.environ["BBS_PASSWORD"] = MOCK_PASSWORD
+
+
+def run_step(module_name, argv):
+    """Runs a step's main() in this process as if called from the command line. Returns (ok, seconds)."""
+    module = importlib.import_module(module_name)
+    saved_argv = sys.argv
+    sys.argv = [module_name] + argv
+    started = time.perf_counter()
+    try:
+        result = module.main()
+    finally:
+        sys.argv = saved_argv
+    return not result, time.perf_counter() - started
+
+
+def count_complete_threads(board, output_dir):
+    """Counts threads whose stored copy holds every post the mock board currently has."""
+    store = open_thread_store(os.path.join(output_dir, str(board.board_id)))
+    complete = 0
+    for thread in board.threads:
+        thread_data = store.load(thread["id"])
+        if thread_data and len(thread_data.get("posts", [])) == thread["replies"] + 1:
+            complete += 1
+    return complete
+
+
+def count_stale_pages(board, edited, output_dir):
+    """Counts edited (thread id, page) pairs whose stored posts differ from what the mock board now serves."""
+    # Imported here, as the step modules read config at import time (see point_config_at).
+    step_2 = importlib.import_module("scraper.step_2_thread")
+    store = open_thread_store(os.path.join(output_dir, str(board.board_id)))
+    stale = 0
+    for thread_id, page in edited:
+        served = []
+        step_2.parse_page_posts(make_soup(board.thread_page(thread_id, page)), page, served)
+        thread_data = store.load(thread_id) or {"posts": []}
+        stored = [post for post in thread_data["posts"] if post.get("page") == page]
+        if [(post["edit_time"], post["content"]) for post in served] != [
+            (post["edit_time"], post["content"]) for post in stored[:len(served)]
+        ]:
+            stale += 1
+    return stale
+
+
+def run_pipeline(label, args, bbs, output_dir, mode):
+    """Runs steps 1-4 once. Returns [(step, ok, seconds, requests served)]."""
+    board_id = str(args.board_id)
+    rate = str(args.requests_per_second)
+    steps = [
+        ("step 1 index", "scraper.step_1_index",
+         ["--board_id", board_id, "--mode", mode, "--workers", str(args.index_workers), "--requests_per_second", rate]),
+        ("step 2 threads", "scraper.step_2_thread",
+         ["--board_id", board_id, "--mode", mode, "--workers", str(args.workers), "--requests_per_second", rate,
+          "--revalidate_pages", str(args.revalidate_pages)]),
+        ("step 3 attachments", "scraper.step_3_download_attachments",
+         ["--board_id", board_id, "--mode", mode, "--workers", str(args.download_workers)]),
+        ("step 4 render", "scraper.step_4_render",
+         ["--board_id", board_id, "--mode", mode, "--jobs", str(args.render_jobs)]),
+    ]
+    if args.skip_attachments:
+        steps.pop(2)
+    if args.boards > 1:
+        board_ids = ",".join(str(args.board_id + i) for i in range(args.boards))
+        steps = [("run_boards", "scraper.run_boards", [
+            "--board_ids", board_ids, "--mode", mode, "--parallel_boards", str(args.parallel_boards),
+            "--workers", str(args.workers), "--index_workers", str(args.index_workers),
+            "--download_workers", str(args.download_workers), "--render_jobs", str(args.render_jobs),
+            "--requests_per_second", rate,
+        ] + (["--skip_attachments"] if args.skip_attachments else []))]
+    elif args.pipeline:
+        steps = [("pipeline", "scraper.pipeline", [
+            "--board_id", board_id, "--mode", mode, "--workers", str(args.workers),
+            "--index_workers", str(args.index_workers), "--download_workers", str(args.download_workers),
+            "--render_jobs", str(args.render_jobs), "--requests_per_second", rate,
+        ] + (["--skip_attachments"] if args.skip_attachments else []))]
+
+    results = []
+    for step_name, module_name, argv in steps:
+        before = bbs.snapshot()
+        print(f"\n===== {label}: {step_name} =====")
+        ok, seconds = run_step(module_name, argv)
+        after = bbs.snapshot()
+        served = {key: after[key] - before[key] for key in after if after[key] != before[key]}
+        results.append((step_name, ok, seconds, served))
+        if not ok:
+            print(f"{step_name} failed, stopping this run.")
+            break
+    return results
+
+
+def print_report(label, results, complete, total_threads, stale, edited):
+    print(f"\n--- {label} ---")
+    print(f"{'step':<20} {'ok':>4} {'seconds':>9} {'requests':>9} {'MB sent':>8}  faults")
+    total = 0.0
+    for step_name, ok, seconds, served in results:
+        total += seconds
+        requests_served = sum(value for key, value in served.items() if key.split(" ", 1)[0] in {"GET", "HEAD", "POST"})
+        faults = ", ".join(f"{key[len('fault_'):]}={value}" for key, value in sorted(served.items())
+                           if key.startswith("fault_"))
+        relogins = served.get("login", 0)
+        if relogins:
+            faults = f"{faults}, logins={relogins}" if faults else f"logins={relogins}"
+        print(f"{step_name:<20} {'yes' if ok else 'NO':>4} {seconds:9.2f} {requests_served:9d} "
+              f"{served.get('bytes_sent', 0) / 1e6:8.1f}  {faults}")
+    print(f"{'total':<20} {'':>4} {total:9.2f}")
+    print(f"Threads complete: {complete}/{total_threads}")
+    if edited:
+        print(f"Edited pages not yet picked up: {stale}/{edited}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run steps 1-4 against a local mock BBS and report end-to-end timings."
+    )
+    add_server_arguments(parser)
+    parser.add_argument("--workers", type=int, default=8, help="Step 2 --workers.")
+    parser.add_argument("--index_workers", type=int, default=4, help="Step 1 --workers.")
+    parser.add_argument("--download_workers", type=int, default=4, help="Step 3 --workers.")
+    parser.add_argument("--render_jobs", type=int, default=2, help="Step 4 --jobs.")
+    parser.add_argument("--requests_per_second", type=float, default=0,
+                        help="Step 1 and 2 rate limit. Defaults to 0 (unlimited), as the server is local.")
+    parser.add_argument("--thread_store", type=str, choices=["json", "sqlite"],
+                        help="Override config.THREAD_STORE.")
+    parser.add_argument("--http_cache_ttl", type=float,
+                        help="Turn on the page cache with this TTL in seconds (0 always revalidates).")
+    parser.add_argument("--adaptive_rate", action="store_true",
+                        help="Turn on config.ADAPTIVE_RATE, starting from --requests_per_second.")
+    parser.add_argument("--skip_attachments", action="store_true", help="Don't run step 3.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run scraper.pipeline instead of the four steps one after another.")
+    parser.add_argument("--parallel_boards", type=int, default=2,
+                        help="scraper.run_boards --parallel_boards, used when --boards is more than 1.")
+    parser.add_argument("--update_rounds", type=int, default=0,
+                        help="After the first full run, add replies to some threads and re-run in update mode.")
+    parser.add_argument("--changed_threads", type=int, default=20,
+                        help="Threads that get new replies before each update round.")
+    parser.add_argument("--edited_pages", type=int, default=0,
+                        help="Thread pages whose posts are edited before each update round.")
+    parser.add_argument("--revalidate_pages", type=int, default=0, help="Step 2 --revalidate_pages.")
+    parser.add_argument("--output_dir", type=str,
+                        help="Keep the scraped output here instead of in a temporary directory.")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else tempfile.mkdtemp(prefix="bbs_e2e_")
+    bbs = make_bbs(args)
+    server, base_url = start_server(bbs)
+    point_config_at(base_url, output_dir)
+    if args.thread_store:
+        config.THREAD_STORE = args.thread_store
+    if args.adaptive_rate:
+        config.ADAPTIVE_RATE = True
+    if args.http_cache_ttl is not None:
+        config.HTTP_CACHE = True
+        config.HTTP_CACHE_TTL = args.http_cache_ttl
+    boards = list(bbs.boards.values())
+    total_threads = sum(len(board.threads) for board in boards)
+    print(f"Mock BBS at {base_url}: {len(boards)} board(s), {total_threads} threads, output in {output_dir}")
+
+    reports = []
+    edited = {board.board_id: set() for board in boards}
+    try:
+        for round_num in range(args.update_rounds + 1):
+            if round_num == 0:
+                label, mode = "full run", "overwrite"
+            else:
+                for board in boards:
+                    board.add_replies(args.changed_threads)
+                    edited[board.board_id].update(board.edit_posts(args.edited_pages))
+                label, mode = f"update round {round_num}", "update"
+            results = run_pipeline(label, args, bbs, output_dir, mode)
+            reports.append((
+                label, results,
+                sum(count_complete_threads(board, output_dir) for board in boards),
+                sum(count_stale_pages(board, edited[board.board_id], output_dir) for board in boards),
+                sum(len(pages) for pages in edited.values()),
+            ))
+            if not all(ok for _, ok, _, _ in results):
+                break
+    finally:
+        server.shutdown()
+        if not args.output_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    for label, results, complete, stale, num_edited in reports:
+        print_report(label, results, complete, total_threads, stale, num_edited)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# benchmarks/fixtures.py
+import base64
+import random
+
+
+def make_post(post_index, rng, paragraphs=3):
+    """Builds one post dict shaped like the output of step_2_thread.parse_post."""
+    sentences = [
+        "这是一段用于基准测试的正文内容。",
+        "Some ASCII text to mix in with the Chinese.",
+        '<a href="jump-to.php?url=https%3A%2F%2Fexample.com%2Fpage%3Fid%3D1">外部链接</a>',
+    ]
+    content = "\n".join(
+        "<p>" + "".join(rng.choice(sentences) for _ in range(rng.randint(2, 8))) + "</p>"
+        for _ in range(paragraphs)
+    )
+    attachments = []
+    if rng.random() < 0.2:
+        attachments.append({
+            "type": "url",
+            "url": f"https://bbs.pku.edu.cn/v2/attach/{post_index}.jpg",
+            "filename": f"{post_index}.jpg",
+        })
+    return {
+        "post_time": f"2020-0{rng.randint(1, 9)}-1{rng.randint(0, 9)} 12:{rng.randint(10, 59)}:00",
+        "edit_time": "N/A",
+        "author": f"user{rng.randint(1, 500)}",
+        "floor": str(post_index - 1) if post_index > 1 else "楼主",
+        "quotes": [{"user": "someone", "text": "被引用的内容"}] if rng.random() < 0.3 else [],
+        "content": content,
+        "attachments": attachments,
+    }
+
+
+def make_thread_data(thread_id, num_posts=10, seed=None):
+    """Builds a thread dict shaped like the JSON files written by step 2."""
+    rng = random.Random(thread_id if seed is None else seed)
+    return {
+        "posts": [make_post(i, rng) for i in range(1, num_posts + 1)],
+        "title": f"基准测试帖子 {thread_id}",
+        "id": str(thread_id),
+        "url": f"https://bbs.pku.edu.cn/v2/post-read.php?bid=1&threadid={thread_id}",
+    }
+
+
+# A 1x1 PNG, repeated to build inline images of a chosen size.
+_PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+def make_inline_image_src(num_bytes):
+    """Returns a data:image/png;base64 URL whose decoded payload is about num_bytes long."""
+    payload = (_PNG_BYTES * (num_bytes // len(_PNG_BYTES) + 1))[:max(num_bytes, len(_PNG_BYTES))]
+    return "data:image/png;base64," + base64.b64encode(payload).decode("ascii")
+
+
+def make_post_card_html(floor, rng, quotes=1, inline_images=0, inline_image_bytes=20_000, paragraphs=3):
+    """Builds one div.post-card as served by post-read.php."""
+    post_time = f"2020-0{rng.randint(1, 9)}-1{rng.randint(0, 9)} 12:{rng.randint(10, 59)}:00"
+    edited = rng.random() < 0.2
+    title_time = "修改于 2021-01-01 08:00:00" if edited else f"发表于 {post_time}"
+
+    body = []
+    for q in range(quotes):
+        body.append(f'<p class="quotehead" data-username="user{q}">【 在 user{q} 的大作中提到: 】</p>')
+        body.append('<p class="blockquote">: 被引用的第一行</p>\n<p class="blockquote">: 被引用的第二行</p>')
+    for _ in range(paragraphs):
+        body.append("<p>" + "这是一段模拟的帖子正文，带有一些 ASCII text。" * rng.randint(1, 6) + "</p>")
+    body.append('<p><a href="jump-to.php?url=https%3A%2F%2Fexample.com%2F">外部链接</a></p>')
+    for _ in range(inline_images):
+        body.append(f'<p><img src="{make_inline_image_src(inline_image_bytes)}"></p>')
+    if rng.random() < 0.2:
+        body.append(f'<p><img src="/v2/attach/img_{floor}.jpg"></p>')
+
+    attachment = ""
+    if rng.random() < 0.1:
+        attachment = (
+            '<div class="attachment"><ul>'
+            f'<li><a href="attach.php?id={floor}">附件{floor}.pdf</a></li>'
+            f'<li><a class="highslide" href="attach.php?id={floor}&amp;thumb=1">缩略图</a></li>'
+            "</ul></div>"
+        )
+
+    return f"""
+<div class="post-card">
+  <div class="post-owner"><p class="username"><a href="user.php?uid={floor}">user{rng.randint(1, 500)}</a></p></div>
+  <div class="post-main">
+    <div class="sl-triangle-container">
+      <span class="title"><span>{title_time}</span></span>
+      <ul class="down-list"><li><span>发表于 {post_time}</span></li></ul>
+    </div>
+    <span class="post-id">{floor}</span>
+    <div class="content"><div class="body">
+{chr(10).join(body)}
+    </div></div>
+    {attachment}
+  </div>
+</div>"""
+
+
+def make_thread_page_html(thread_id, board_id=1, page=1, total_pages=1, posts_per_page=30, seed=None,
+                          num_posts=None, **card_options):
+    """Builds a post-read.php thread page whose layout matches what step 2 parses.
+
+    num_posts is the number of cards on this page, e.g. fewer on the last page.
+    """
+    rng = random.Random(f"{thread_id}-{page}" if seed is None else seed)
+    first_floor = (page - 1) * posts_per_page
+    cards = "".join(
+        make_post_card_html(first_floor + i, rng, **card_options)
+        for i in range(posts_per_page if num_posts is None else num_posts)
+    )
+    paging = f'<div class="paging"><span>{page}</span><span>/ {total_pages}</span></div>' if total_pages > 1 else ""
+    return f"""<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<link rel="alternate" href="post-read.php?bid={board_id}&amp;threadid={thread_id}">
+<title>帖子 {thread_id}</title>
+</head><body>
+<div id="page-post">
+<header><h3>基准测试帖子 {thread_id}</h3></header>
+{paging}
+<div class="card-list">{cards}</div>
+{paging}
+</div>
+</body></html>"""
+
+
+def make_index_page_html(board_id=1, page=1, total_pages=1, threads_per_page=30, seed=None,
+                         board_name="Benchmark", rows=None):
+    """Builds a thread.php topic index page whose layout matches what step 1 parses.
+
+    rows, if given, is a list of dicts with id, replies, post_date and
+    last_reply_date to show instead of random threads.
+    """
+    rng = random.Random(f"index-{board_id}-{page}" if seed is None else seed)
+    if rows is None:
+        first_thread_id = 100000 - (page - 1) * threads_per_page
+        rows = [
+            {
+                "id": first_thread_id - i,
+                "replies": rng.randint(0, 200),
+                "post_date": f"2015-03-0{rng.randint(1, 9)}",
+                "last_reply_date": f"20{rng.randint(10, 23)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            }
+            for i in range(threads_per_page)
+        ]
+    items = []
+    for row in rows:
+        thread_id = row["id"]
+        items.append(f"""
+<div class="list-item-topic list-item">
+  <div class="id l">{thread_id}</div>
+  <div class="title-cont l"><a class="link" href="post-read.php?bid={board_id}&amp;threadid={thread_id}"></a>
+    <div class="title l limit">帖子标题 {thread_id}</div></div>
+  <div class="author l"><div class="name limit">user{rng.randint(1, 500)}</div><div class="time">{row["post_date"]}</div></div>
+  <div class="reply-num l">{row["replies"]}</div>
+  <div class="author l"><div class="name limit">user{rng.randint(1, 500)}</div><div class="time">{row["last_reply_date"]}</div></div>
+</div>""")
+
+    next_button = f'<div class="paging-button"><a href="thread.php?bid={board_id}&amp;mode=topic&amp;page={page + 1}">下一页</a></div>' if page < total_pages else '<div class="paging-button">下一页</div>'
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{board_name}</title></head><body>
+<div class="breadcrumb-trail"><a href="index.php">首页</a> <a href="board.php?bid={board_id}">{board_name}</a></div>
+<div id="title"><span class="title-text">版面</span><span class="title-text eng">{board_name}</span></div>
+<div id="list-content">{"".join(items)}</div>
+<div class="paging"><span>{page}</span><span>/ {total_pages}</span>{next_button}</div>
+</body></html>"""
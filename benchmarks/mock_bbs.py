@@ -0,0 +1,454 @@
+# benchmarks/mock_bbs.py
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.fixtures import make_index_page_html, make_thread_page_html
+
+MOCK_USERNAME = "mock_user"
+MOCK_PASSWORD = "mock_password"
+SESSION_COOKIE = "skey"
+
+
+class MockBoard:
+    """A synthetic board whose index and thread pages are generated on demand.
+
+    Thread pages are seeded by (thread id, page), so a page looks the same every
+    time it is served, and only grows when add_replies() appends posts or changes
+    when edit_posts() edits it.
+    """
+
+    def __init__(self, board_id, num_threads, name="MockBoard", max_replies=60, posts_per_page=30,
+                 threads_per_page=30, inline_images=0, seed=0):
+        self.board_id = board_id
+        self.name = name
+        self.posts_per_page = posts_per_page
+        self.threads_per_page = threads_per_page
+        self.inline_images = inline_images
+        self.rng = random.Random(f"board-{board_id}-{seed}")
+        self.today = date(2024, 6, 1)
+
+        self.threads = []
+        for i in range(num_threads):
+            last_reply = self.today - timedelta(days=i // 5)
+            self.threads.append({
+                "id": 1_000_000 + num_threads - i,
+                "replies": self.rng.randint(0, max_replies),
+                "post_date": (last_reply - timedelta(days=self.rng.randint(0, 30))).isoformat(),
+                "last_reply_date": last_reply.isoformat(),
+            })
+        self.by_id = {thread["id"]: thread for thread in self.threads}
+        self.edits = Counter()  # (thread id, page) -> number of times the page was edited
+
+    def total_index_pages(self):
+        return max(1, -(-len(self.threads) // self.threads_per_page))
+
+    def total_thread_pages(self, thread):
+        return max(1, -(-(thread["replies"] + 1) // self.posts_per_page))
+
+    def index_page(self, page):
+        start = (page - 1) * self.threads_per_page
+        rows = self.threads[start:start + self.threads_per_page]
+        return make_index_page_html(
+            board_id=self.board_id, page=page, total_pages=self.total_index_pages(),
+            board_name=self.name, rows=rows,
+        )
+
+    def thread_page(self, thread_id, page):
+        """Returns the HTML of one page of a thread, or None if it doesn't exist."""
+        thread = self.by_id.get(thread_id)
+        if thread is None:
+            return None
+        total_pages = self.total_thread_pages(thread)
+        page = min(max(1, page), total_pages)
+        num_posts = min(self.posts_per_page, thread["replies"] + 1 - (page - 1) * self.posts_per_page)
+        return make_thread_page_html(
+            thread_id, board_id=self.board_id, page=page, total_pages=total_pages,
+            posts_per_page=self.posts_per_page, num_posts=num_posts, inline_images=self.inline_images,
+            seed=f"{thread_id}-{page}-edit{self.edits[thread_id, page]}" if self.edits[thread_id, page] else None,
+        )
+
+    def add_replies(self, num_threads, max_new_replies=10):
+        """Simulates activity between runs: some threads get new replies and move to the top."""
+        self.today += timedelta(days=1)
+        for thread in self.rng.sample(self.threads, min(num_threads, len(self.threads))):
+            thread["replies"] += self.rng.randint(1, max_new_replies)
+            thread["last_reply_date"] = self.today.isoformat()
+        self.threads.sort(key=lambda thread: thread["last_reply_date"], reverse=True)
+
+    def edit_posts(self, num_pages):
+        """Edits the posts on some thread pages without touching reply counts or dates, as the index shows."""
+        pages = [(thread["id"], page) for thread in self.threads for page in range(1, self.total_thread_pages(thread) + 1)]
+        edited = self.rng.sample(pages, min(num_pages, len(pages)))
+        for key in edited:
+            self.edits[key] += 1
+        return edited
+
+
+def attachment_body(path, base_size):
+    """Deterministic attachment content of roughly base_size bytes for a URL path."""
+    digest = hashlib.sha256(path.encode("utf-8")).digest()
+    size = max(1, base_size // 2 + int.from_bytes(digest[:4], "big") % max(1, base_size))
+    return (digest * (size // len(digest) + 1))[:size]
+
+
+class MockBBS:
+    """State shared by all request handlers: boards, login sessions, fault injection and counters."""
+
+    def __init__(self, boards, latency=0.0, jitter=0.0, error_rate=0.0, login_expiry_rate=0.0,
+                 truncate_rate=0.0, attachment_bytes=100_000, page_validators=False, capacity=0,
+                 cookie_lifetime=0, missing_attachment_rate=0.0,
+                 gzip_attachments=False, seed=0):
+        self.boards = {board.board_id: board for board in boards}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.login_expiry_rate = login_expiry_rate
+        self.truncate_rate = truncate_rate
+        self.attachment_bytes = attachment_bytes
+        self.page_validators = page_validators
+        self.capacity = capacity
+        self.cookie_lifetime = cookie_lifetime
+        self.missing_attachment_rate = missing_attachment_rate
+        self.gzip_attachments = gzip_attachments
+        self._recent_pages = deque()
+        self.rng = random.Random(seed)
+        self.sessions = {}  # token -> time it expires, or None
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def overloaded(self):
+        """Counts a page request. Returns True if more than capacity arrived within the last second."""
+        if self.capacity <= 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self._recent_pages and self._recent_pages[0] <= now - 1:
+                self._recent_pages.popleft()
+            self._recent_pages.append(now)
+            return len(self._recent_pages) > self.capacity
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self.rng.random() * self.jitter
+            time.sleep(self.latency + extra)
+
+    def new_session(self):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[token] = time.time() + self.cookie_lifetime if self.cookie_lifetime > 0 else None
+        return token
+
+    def is_logged_in(self, token):
+        with self.lock:
+            if token not in self.sessions:
+                return False
+            expires = self.sessions[token]
+            return expires is None or time.time() < expires
+
+    def expire_session(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.stats)
+
+
+class MockBBSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so the scraper's connection pool is exercised.
+
+    @property
+    def bbs(self):
+        return self.server.bbs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        self.bbs.count("bytes_sent", len(body))
+
+    def _session_token(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+
+    def _require_login(self):
+        """Redirects to the login page unless the request carries a live session. Returns True if allowed."""
+        token = self._session_token()
+        if token and self.bbs.is_logged_in(token) and self.bbs.roll(self.bbs.login_expiry_rate):
+            # The session expires under the scraper's feet, as happens on the real site.
+            self.bbs.expire_session(token)
+            self.bbs.count("fault_login_expired")
+        if token and self.bbs.is_logged_in(token):
+            return True
+        self.bbs.count("login_redirect")
+        self._send(302, headers={"Location": "/v2/login.php"})
+        return False
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        path = parts.path
+        if path.startswith("/v2/"):
+            path = path[len("/v2/"):]
+        return path, query
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path, query = self._route()
+        endpoint = "attach" if path.startswith("attach") else path
+        self.bbs.count(f"{self.command} {endpoint}")
+        self.bbs.delay()
+
+        if path == "login.php":
+            self._send(200, f'<html><body id="page-login"><span id="global-time">{int(time.time())}</span>'
+                            f'<form data-action="login"></form></body></html>')
+            return
+
+        if self.bbs.roll(self.bbs.error_rate):
+            self.bbs.count("fault_error")
+            self._send(self.bbs.rng.choice((500, 502, 503)), "<html><body>Server error</body></html>")
+            return
+
+        if path in ("thread.php", "post-read.php") and self.bbs.overloaded():
+            self.bbs.count("fault_overloaded")
+            self._send(503, "<html><body>Server busy</body></html>")
+            return
+
+        if not self._require_login():
+            return
+
+        if path == "thread.php":
+            self._serve_index(query)
+        elif path == "post-read.php":
+            self._serve_thread(query)
+        elif endpoint == "attach":
+            self._serve_attachment()
+        else:
+            self._send(404, "<html><body>Not found</body></html>")
+
+    def do_POST(self):
+        path, _ = self._route()
+        self.bbs.count(f"POST {path}")
+        self.bbs.delay()
+        length = int(self.headers.get("Content-Length", 0))
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        if path != "ajax/login.php":
+            self._send(404, "<html><body>Not found</body></html>")
+            return
+
+        username = form.get("username", "")
+        password = form.get("password", "")
+        expected = hashlib.md5(f"{password}{username}{form.get('time', '')}{password}".encode("utf-8")).hexdigest()
+        if username != MOCK_USERNAME or password != MOCK_PASSWORD or form.get("t") != expected:
+            self._send(200, json.dumps({"success": False, "error": 1}), content_type="application/json")
+            return
+
+        self.bbs.count("login")
+        self._send(
+            200,
+            json.dumps({"success": True}),
+            content_type="application/json",
+            headers={"Set-Cookie": f"{SESSION_COOKIE}={self.bbs.new_session()}; Path=/" + (
+                f"; Max-Age={int(self.bbs.cookie_lifetime)}" if self.bbs.cookie_lifetime > 0 else ""
+            )},
+        )
+
+    def _board(self, query):
+        try:
+            return self.bbs.boards.get(int(query.get("bid", 0)))
+        except ValueError:
+            return None
+
+    def _send_page(self, html):
+        headers = {}
+        if self.bbs.page_validators:
+            etag = f'"{hashlib.sha1(html.encode("utf-8")).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.bbs.count("not_modified")
+                self._send(304, headers={"ETag": etag})
+                return
+            headers["ETag"] = etag
+        if self.bbs.roll(self.bbs.truncate_rate):
+            # A page cut off mid-way, like the incomplete pages the real site sometimes returns.
+            self.bbs.count("fault_truncated")
+            html = html[:self.bbs.rng.randint(0, len(html) // 2)]
+        self._send(200, html, headers=headers)
+
+    def _serve_index(self, query):
+        board = self._board(query)
+        if board is None:
+            self._send(404, "<html><body>No such board</body></html>")
+            return
+        self._send_page(board.index_page(int(query.get("page", 1))))
+
+    def _serve_thread(self, query):
+        board = self._board(query)
+        html = board.thread_page(int(query.get("threadid", 0)), int(query.get("page", 1))) if board else None
+        if html is None:
+            self._send(404, "<html><body>No such thread</body></html>")
+            return
+        self._send_page(html)
+
+    def _serve_attachment(self):
+        # Decided by the URL rather than rolled, so a missing attachment stays missing on every retry.
+        digest = hashlib.sha256(f"missing-{self.path}".encode("utf-8")).digest()
+        if int.from_bytes(digest[:4], "big") / 2**32 < self.bbs.missing_attachment_rate:
+            self.bbs.count("fault_missing_attachment")
+            self._send(404, "<html><body>No such attachment</body></html>")
+            return
+        body = attachment_body(self.path, self.bbs.attachment_bytes)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        total = len(body)
+        start = 0
+
+        range_header = self.headers.get("Range", "")
+        if_range = self.headers.get("If-Range")
+        if range_header.startswith("bytes=") and (if_range is None or if_range == etag):
+            start = int(range_header[len("bytes="):].split("-", 1)[0] or 0)
+            if start >= total:
+                self._send(416, headers={"Content-Range": f"bytes */{total}"})
+                return
+
+        status = 206 if start else 200
+        chunk = body[start:]
+        # Like a server compressing on the fly: Content-Length is then the size of the gzip stream.
+        gzipped = (self.bbs.gzip_attachments and status == 200
+                   and "gzip" in self.headers.get("Accept-Encoding", ""))
+        if gzipped:
+            chunk = gzip.compress(chunk, mtime=0)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(chunk)))
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{total - 1}/{total}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        if len(chunk) > 1 and self.bbs.roll(self.bbs.truncate_rate):
+            # Drop the connection mid-transfer so the client has to resume.
+            self.bbs.count("fault_truncated_download")
+            chunk = chunk[:self.bbs.rng.randint(1, len(chunk) - 1)]
+            self.close_connection = True
+        self.wfile.write(chunk)
+        self.bbs.count("bytes_sent", len(chunk))
+
+
+def start_server(bbs, host="127.0.0.1", port=0):
+    """Starts the mock BBS in a background thread. Returns (server, base URL of the /v2/ site)."""
+    server = ThreadingHTTPServer((host, port), MockBBSHandler)
+    server.daemon_threads = True
+    server.bbs = bbs
+    threading.Thread(target=server.serve_forever, name="mock-bbs", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v2/"
+
+
+def add_server_arguments(parser):
+    """Command line options shared by the standalone server and the end-to-end harness."""
+    parser.add_argument("--board_id", type=int, default=1, help="ID of the generated board.")
+    parser.add_argument("--threads", type=int, default=300, help="Number of threads on the board.")
+    parser.add_argument("--boards", type=int, default=1,
+                        help="Number of boards, with IDs from --board_id up. Board i has --threads / (i + 1) threads.")
+    parser.add_argument("--max_replies", type=int, default=60, help="Maximum replies per thread.")
+    parser.add_argument("--inline_images", type=int, default=0, help="Base64 inline images per post.")
+    parser.add_argument("--attachment_bytes", type=int, default=100_000, help="Typical attachment size.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every response.")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Random extra seconds per response.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of requests answered with a 5xx.")
+    parser.add_argument("--login_expiry_rate", type=float, default=0.0,
+                        help="Share of requests whose session expires, forcing a re-login.")
+    parser.add_argument("--truncate_rate", type=float, default=0.0,
+                        help="Share of pages cut off and downloads dropped mid-transfer.")
+    parser.add_argument("--cookie_lifetime", type=float, default=0,
+                        help="Seconds a login lasts; the cookie says so with Max-Age. 0 means it never expires.")
+    parser.add_argument("--missing_attachment_rate", type=float, default=0.0,
+                        help="Share of attachment URLs that always answer 404.")
+    parser.add_argument("--gzip_attachments", action="store_true",
+                        help="Gzip attachments for clients that accept it, as some servers do.")
+    parser.add_argument("--page_validators", action="store_true",
+                        help="Send ETags with pages and answer conditional requests with 304.")
+    parser.add_argument("--capacity", type=float, default=0,
+                        help="Index and thread pages served per second before answering 503. 0 means no limit.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated board and faults.")
+
+
+def make_bbs(args):
+    boards = [
+        MockBoard(
+            args.board_id + i, max(1, args.threads // (i + 1)), max_replies=args.max_replies,
+            inline_images=args.inline_images, seed=args.seed,
+        )
+        for i in range(max(1, args.boards))
+    ]
+    return MockBBS(
+        boards, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        login_expiry_rate=args.login_expiry_rate, truncate_rate=args.truncate_rate,
+        attachment_bytes=args.attachment_bytes, page_validators=args.page_validators, capacity=args.capacity,
+        cookie_lifetime=args.cookie_lifetime, missing_attachment_rate=args.missing_attachment_rate,
+        gzip_attachments=args.gzip_attachments, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic BBS board locally for load testing.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    bbs = make_bbs(args)
+    server, base_url = start_server(bbs, port=args.port)
+    for board in bbs.boards.values():
+        print(f"Mock BBS serving board {board.board_id} with {len(board.threads)} threads at {base_url}")
+    print(f"Point config.BASE_URL at {base_url}, BBS_LOGIN_URL at {base_url}login.php and "
+          f"BBS_LOGIN_API_URL at {base_url}ajax/login.php, and log in as "
+          f"BBS_USERNAME={MOCK_USERNAME} BBS_PASSWORD={MOCK_PASSWORD}.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,10 @@
 # For example, for "蒙养山人类学学社(MANYATTA)", the URL is
 # https://bbs.pku.edu.cn/v2/thread.php?bid=1090, so the BOARD_ID is 1090.
 BOARD_ID = 1090  # 蒙养山人类学学社 for testing
+# Boards run by `python -m scraper.run_boards` (can be overridden by --board_ids). Empty means [BOARD_ID].
+BOARD_IDS = []
+# Number of boards run_boards works on at the same time; they share the workers and the rate limit.
+PARALLEL_BOARDS = 2
 
 # The run mode. Can be 'overwrite' or 'update'.
 # 'overwrite': Scrapes everything from the beginning.
@@ -21,14 +25,88 @@ BBS_COOKIE_FILE = ".bbs_cookies"
 THREAD_PAGE_TIMEOUT = 180
 THREAD_PAGE_RETRIES = 4
 THREAD_PAGE_RETRY_DELAYS = (0, 5, 15, 30)
+# Posts shown on a full thread page. A single-page thread without its closing </html> that has fewer
+# posts is taken as cut off and fetched again; longer threads are checked for the paging bar below the posts.
+THREAD_POSTS_PER_PAGE = 30
+# Log in again this many seconds before the login cookies expire, if they carry an expiry time.
+COOKIE_EXPIRY_MARGIN = 300
+# Thread pages re-fetched per step 2 run to catch edits to old posts, least recently verified first
+# (can be overridden by --revalidate_pages). Threads whose pages changed are crawled again. 0 disables it.
+REVALIDATE_PAGES = 0
+# Threads that fail in step 2 are retried after CRAWL_RETRY_BASE_DELAY seconds, doubling with each failure
+# in a row up to CRAWL_RETRY_MAX_DELAY. Retries due within CRAWL_RETRY_WAIT seconds are waited for in the
+# same run, later ones happen in a later run. The state is kept in output/<board>/crawl_frontier.jsonl.
+CRAWL_RETRY_BASE_DELAY = 5
+CRAWL_RETRY_MAX_DELAY = 86400
+CRAWL_RETRY_WAIT = 30
+
+# HTML parser backend used by BeautifulSoup: "html.parser" (pure Python, always available)
+# or "lxml" (much faster, needs `pip install lxml`). Falls back to "html.parser" if not installed.
+HTML_PARSER = "html.parser"
+
+# Concurrency and politeness
+# Number of threads crawled in parallel by step 2 (can be overridden by --workers).
+THREAD_WORKERS = 1
+# Number of index pages fetched in parallel by step 1 in overwrite mode (can be overridden by --workers).
+INDEX_WORKERS = 1
+# Global cap on BBS page requests per second, shared by all workers. 0 disables the limit.
+REQUESTS_PER_SECOND = 1.0
+REQUESTS_BURST = 1
+# Let the request rate follow the server's health: it rises while pages come back quickly, and is halved
+# on timeouts, 5xx answers or suspicious thread pages (the retry delays in THREAD_PAGE_RETRY_DELAYS are
+# then skipped, as the lower rate already spaces the retries out). REQUESTS_PER_SECOND is the starting
+# rate, and the rate stays between ADAPTIVE_RATE_MIN and ADAPTIVE_RATE_MAX.
+ADAPTIVE_RATE = False
+ADAPTIVE_RATE_MIN = 0.2
+ADAPTIVE_RATE_MAX = 10.0
+# Requests per second added for every second of healthy traffic, and the factor applied on a failure.
+ADAPTIVE_RATE_INCREASE = 0.2
+ADAPTIVE_RATE_DECREASE = 0.5
+# Answers slower than this many seconds hold the rate instead of raising it.
+ADAPTIVE_RATE_LATENCY = 2.0
+# Maximum number of keep-alive connections kept open to the BBS.
+HTTP_POOL_SIZE = 10
+
+# On-disk cache of index and thread pages, shared by all boards (OUTPUT_DIR/HTTP_CACHE_DIR_NAME).
+# Pages younger than HTTP_CACHE_TTL seconds are reused without a request, so keep the TTL shorter than
+# the interval between update runs. Older pages are revalidated with a conditional request when the
+# server sent an ETag or Last-Modified header. Least recently used pages are dropped beyond HTTP_CACHE_MAX_MB.
+HTTP_CACHE = False
+HTTP_CACHE_DIR_NAME = ".http_cache"
+HTTP_CACHE_TTL = 3600
+HTTP_CACHE_MAX_MB = 500
 
 # Output directory structure
 OUTPUT_DIR = "output"
 DATA_DIR_NAME = "data"
 JSON_DIR_NAME = "jsons"
+# Where crawled threads are stored: "json" (one JSON_DIR_NAME/<id>.json file per thread)
+# or "sqlite" (one THREAD_DB_NAME database per board). Convert with `python -m scraper.storage`.
+THREAD_STORE = "json"
+THREAD_DB_NAME = "threads.sqlite"
+# Write thread JSON files without indentation. Smaller and faster (especially with orjson installed),
+# but harder to read by eye. Existing files are rewritten in the new format the next time they are saved.
+JSON_COMPACT = False
 
 # Whether to download attachments. If set to False, attachment folders won't be created
 # and the HTML will indicate that the files were not downloaded.
 ATTACHMENT_DIR_NAME = "attachments"
+# Store attachments once in a content-addressed blob store shared by all boards
+# (OUTPUT_DIR/BLOB_STORE_DIR_NAME) instead of per thread under each board's ATTACHMENT_DIR_NAME.
+SHARED_ATTACHMENT_STORE = False
+BLOB_STORE_DIR_NAME = "_blobs"
+# Let step 2 decode base64 inline images and save them as attachment files right away, keeping only
+# their name, hash and size in the JSON. If False, the base64 data stays in the JSON until step 3.
+INLINE_IMAGES_TO_DISK = True
+# Number of threads whose attachments are downloaded in parallel by step 3 (can be overridden by --workers).
+DOWNLOAD_WORKERS = 4
+# Attachments are streamed to disk in chunks of this many bytes.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 HTML_DIR_NAME = "html"
 TEMPLATES_DIR = "templates"
+# Compiled Jinja template bytecode is cached here, under OUTPUT_DIR.
+JINJA_CACHE_DIR_NAME = ".jinja_cache"
+# Number of worker processes rendering threads in parallel in step 4 (can be overridden by --jobs).
+RENDER_JOBS = 1
+# Threads waiting between two stages of `python -m scraper.pipeline` before the earlier stage pauses.
+PIPELINE_QUEUE_SIZE = 100
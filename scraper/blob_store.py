@@ -0,0 +1,191 @@
+# scraper/blob_store.py
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from scraper.serialization import set_default_mode
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_ext(filename):
+    """Keeps the lowercase extension of an attachment name so browsers still recognize the blob type."""
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if len(ext) <= 10 else ""
+
+
+class BlobStore:
+    """Content-addressed attachment store shared by all boards under config.OUTPUT_DIR.
+
+    Files are stored once under objects/<hash[:2]>/<sha256><ext>. An SQLite index
+    maps attachment URLs and (board, thread, filename) references to blob hashes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite")
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                ext TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS refs (
+                board_id TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (board_id, thread_id, filename)
+            );
+            """
+        )
+        conn.commit()
+
+    def _conn(self):
+        # SQLite connections can't be shared between threads, so each worker gets its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=60)
+            self._local.conn = conn
+        return conn
+
+    def _relative_blob_path(self, blob_hash, ext):
+        return os.path.join("objects", blob_hash[:2], f"{blob_hash}{ext}")
+
+    def blob_path(self, blob_hash):
+        """Returns the absolute path of a stored blob, or None if it is unknown or missing on disk."""
+        row = self._conn().execute("SELECT ext FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if not row:
+            return None
+        path = os.path.join(self.root, self._relative_blob_path(blob_hash, row[0]))
+        return path if os.path.exists(path) else None
+
+    def tmp_path(self, key):
+        """Returns a stable scratch path for downloading the blob identified by key."""
+        return os.path.join(self.tmp_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def lookup_url(self, url):
+        """Returns the hash of an already stored download of url, if any."""
+        row = self._conn().execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if row and self.blob_path(row[0]):
+            return row[0]
+        return None
+
+    def _insert_blob(self, blob_hash, size, ext, source_path):
+        conn = self._conn()
+        row = conn.execute("SELECT ext FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if row:
+            ext = row[0]
+        target = os.path.join(self.root, self._relative_blob_path(blob_hash, ext))
+        if os.path.exists(target):
+            # Same content is already stored, possibly by another worker a moment ago.
+            try:
+                os.remove(source_path)
+            except FileNotFoundError:
+                pass
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source_path, target)
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, ext) VALUES (?, ?, ?)", (blob_hash, size, ext)
+        )
+        conn.commit()
+
+    def put_file(self, path, filename):
+        """Moves a finished download into the store and returns its hash."""
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                hasher.update(chunk)
+        blob_hash = hasher.hexdigest()
+        self._insert_blob(blob_hash, os.path.getsize(path), _file_ext(filename), path)
+        return blob_hash
+
+    def put_bytes(self, data, filename):
+        """Stores in-memory content (e.g. a decoded inline image) and returns its hash."""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        if self.blob_path(blob_hash):
+            return blob_hash
+        # A scratch file of its own, as other workers may be storing the same content right now.
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        set_default_mode(tmp_path)  # The rendered HTML links to blobs, so keep them readable.
+        self._insert_blob(blob_hash, len(data), _file_ext(filename), tmp_path)
+        return blob_hash
+
+    def add_ref(self, board_id, thread_id, filename, blob_hash, url=None):
+        """Records that an attachment of a thread is stored as blob_hash."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO refs (board_id, thread_id, filename, hash) VALUES (?, ?, ?, ?)",
+            (str(board_id), str(thread_id), filename, blob_hash),
+        )
+        if url:
+            conn.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, blob_hash))
+        conn.commit()
+
+    def resolve(self, board_id, thread_id, filename):
+        """Returns the absolute blob path of a thread attachment, or None if it is not stored."""
+        row = self._conn().execute(
+            "SELECT hash FROM refs WHERE board_id = ? AND thread_id = ? AND filename = ?",
+            (str(board_id), str(thread_id), filename),
+        ).fetchone()
+        return self.blob_path(row[0]) if row else None
+
+    def resolve_thread(self, board_id, thread_id):
+        """Returns {filename: absolute blob path} for all stored attachments of a thread."""
+        rows = self._conn().execute(
+            "SELECT refs.filename, refs.hash, blobs.ext FROM refs JOIN blobs ON refs.hash = blobs.hash "
+            "WHERE refs.board_id = ? AND refs.thread_id = ?",
+            (str(board_id), str(thread_id)),
+        ).fetchall()
+        paths = {}
+        for filename, blob_hash, ext in rows:
+            path = os.path.join(self.root, self._relative_blob_path(blob_hash, ext))
+            if os.path.exists(path):
+                paths[filename] = path
+        return paths
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returns the shared blob store, or None if config.SHARED_ATTACHMENT_STORE is off."""
+    global _store, _store_pid
+    if not getattr(config, "SHARED_ATTACHMENT_STORE", False):
+        return None
+    with _store_lock:
+        # SQLite connections must not cross a fork, so worker processes open their own store.
+        if _store is None or _store_pid != os.getpid():
+            root = os.path.join(config.OUTPUT_DIR, getattr(config, "BLOB_STORE_DIR_NAME", "_blobs"))
+            _store = BlobStore(root)
+            _store_pid = os.getpid()
+        return _store
+
+
+def board_id_from_path(board_path):
+    """Board output folders are named after the board id."""
+    return os.path.basename(os.path.normpath(board_path))
@@ -0,0 +1,207 @@
+# scraper/http_cache.py
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from scraper.serialization import write_atomic
+
+
+class HttpCache:
+    """On-disk cache of fetched pages, keyed by URL.
+
+    Bodies are stored as files under bodies/, and an SQLite index keeps their
+    ETag, Last-Modified, content hash, fetch time and last access time. Entries
+    younger than ttl seconds are served without a request; older ones are
+    revalidated with a conditional request when the server sent validators.
+    The least recently used entries are evicted beyond max_bytes.
+    """
+
+    def __init__(self, root, ttl=0, max_bytes=0):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bodies_dir = os.path.join(root, "bodies")
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+            """
+        )
+        conn.commit()
+        self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _conn(self):
+        # SQLite connections can't be shared between threads, so each worker gets its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=60)
+            self._local.conn = conn
+        return conn
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _body_path(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.bodies_dir, key[:2], key)
+
+    def get(self, url):
+        """Returns the cached entry for url as a dict, or None."""
+        row = self._conn().execute(
+            "SELECT etag, last_modified, encoding, body_hash, size, fetched_at FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, encoding, body_hash, size, fetched_at = row
+        return {
+            "url": url, "etag": etag, "last_modified": last_modified, "encoding": encoding,
+            "body_hash": body_hash, "size": size, "fetched_at": fetched_at,
+        }
+
+    def is_fresh(self, entry):
+        return self.ttl > 0 and time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_text(self, entry, refreshed=False):
+        """Returns the cached body as text and marks the entry as used, or None if the body file is gone."""
+        try:
+            with open(self._body_path(entry["url"]), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            self.invalidate(entry["url"])
+            return None
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            if refreshed:
+                conn.execute("UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, entry["url"]))
+            else:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (now, entry["url"]))
+        return body.decode(entry["encoding"] or "utf-8", errors="replace")
+
+    def put(self, url, response):
+        """Stores a successful response. Returns its body as text, decoded the same way requests does."""
+        body = response.content
+        text = response.text
+        path = self._body_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, body)
+
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            previous = conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(url, etag, last_modified, encoding, body_hash, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url, response.headers.get("ETag"), response.headers.get("Last-Modified"), response.encoding,
+                    hashlib.sha1(body).hexdigest(), len(body), now, now,
+                ),
+            )
+        with self._lock:
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            over_limit = self.max_bytes and self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+        return text
+
+    def invalidate(self, url):
+        """Drops a cached page, e.g. one that turned out to be incomplete."""
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+        with self._lock:
+            self.total_bytes -= row[0]
+        try:
+            os.remove(self._body_path(url))
+        except FileNotFoundError:
+            pass
+        self.count("invalidated")
+
+    def evict(self):
+        """Drops least recently used entries until the cache is below 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        conn = self._conn()
+        for url, size in conn.execute("SELECT url, size FROM entries ORDER BY accessed_at").fetchall():
+            with self._lock:
+                if self.total_bytes <= target:
+                    break
+            with conn:
+                conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            with self._lock:
+                self.total_bytes -= size
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            self.count("evicted")
+
+    def format_stats(self):
+        with self._lock:
+            stats = Counter(self.stats)
+        requests_seen = stats["hit"] + stats["revalidated"] + stats["miss"]
+        hit_rate = (stats["hit"] + stats["revalidated"]) / requests_seen if requests_seen else 0
+        return (
+            f"HTTP cache: {stats['hit']} hits, {stats['revalidated']} revalidated (304), {stats['miss']} misses "
+            f"({hit_rate:.0%} served from cache), {stats['invalidated']} invalidated, {stats['evicted']} evicted, "
+            f"{self.total_bytes / 1e6:.1f} MB on disk"
+        )
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    """Returns the shared page cache, or None if config.HTTP_CACHE is off."""
+    global _cache, _cache_pid
+    if not getattr(config, "HTTP_CACHE", False):
+        return None
+    with _cache_lock:
+        # SQLite connections must not cross a fork, so worker processes open their own cache.
+        if _cache is None or _cache_pid != os.getpid():
+            root = os.path.join(config.OUTPUT_DIR, getattr(config, "HTTP_CACHE_DIR_NAME", ".http_cache"))
+            _cache = HttpCache(
+                root,
+                ttl=getattr(config, "HTTP_CACHE_TTL", 0),
+                max_bytes=getattr(config, "HTTP_CACHE_MAX_MB", 500) * 1024 * 1024,
+            )
+            _cache_pid = os.getpid()
+        return _cache
@@ -0,0 +1,295 @@
+# scraper/pipeline.py
+import argparse
+from alive_progress import alive_bar
+import csv
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from urllib.parse import urljoin
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from scraper.step_1_index import crawl_index
+from scraper.step_2_thread import crawl_and_save, needs_crawl, print_update_stats
+from scraper.step_3_download_attachments import format_bytes, process_thread, throughput
+from scraper.step_4_render import (
+    RenderPool,
+    load_render_manifest,
+    render_indices,
+    render_thread_job,
+    save_render_manifest,
+    template_fingerprint,
+)
+from scraper.storage import get_thread_store
+from scraper.utils import (
+    get_board_path,
+    print_http_cache_stats,
+    print_rate_stats,
+    print_session_stats,
+    set_request_rate,
+)
+
+
+CRAWL_ATTEMPTS = 3
+CRAWL_RETRY_DELAY = 5
+
+_DONE = object()  # Put on a queue after the last item.
+
+
+class Stage:
+    """A pool of worker threads that take items from inbox, apply func and pass the results on to outbox.
+
+    The queues are bounded, so a slow stage makes the ones before it wait instead of piling up work.
+    func returns None for items that should go no further.
+    """
+
+    def __init__(self, name, func, workers, inbox, outbox=None):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.done = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i + 1}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                self.inbox.put(_DONE)  # Let the other workers of this stage see it too.
+                return
+            try:
+                result = self.func(item)
+            except Exception as e:
+                logging.exception(f"Unexpected error in the {self.name} stage for {item}: {e}")
+                result = None
+            with self._lock:
+                if result is None:
+                    self.failed += 1
+                else:
+                    self.done += 1
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+    def finish(self):
+        """Waits for the workers to drain the inbox, then tells the next stage that nothing more is coming."""
+        for thread in self._threads:
+            thread.join()
+        if self.outbox is not None:
+            self.outbox.put(_DONE)
+
+
+def start_render_pool(render_jobs):
+    """Starts a pool of render processes. Call it before starting any threads, as the workers are forked."""
+    render_pool = RenderPool(max_workers=render_jobs)
+    # With fork, the first task starts every worker process, so they are all created now.
+    render_pool.submit(os.getpid).result()
+    return render_pool
+
+
+def print_process_totals(mode, skip_attachments=False):
+    """Prints the summary lines that count everything this process did, across all boards."""
+    if not skip_attachments:
+        print(f"Attachments downloaded: {format_bytes(throughput.total_bytes)}")
+    if mode == 'update':
+        print_update_stats()
+    print_http_cache_stats()
+    print_rate_stats()
+    print_session_stats()
+
+
+def run_pipeline(board_id, mode, workers, index_workers, download_workers, render_jobs, queue_size,
+                 skip_attachments=False, render_pool=None, show_progress=True, print_totals=True):
+    """Runs steps 1-4 for one board, with each thread passed on to the next step as soon as it is ready.
+
+    Rendering runs in render_pool if one is given (it is not shut down), otherwise in a pool of
+    render_jobs processes started here. The summary includes counters kept for the whole process
+    (bytes downloaded, update, cache, rate and session stats) only with print_totals, as they mix
+    boards run side by side. Returns a dict of counts for the summary, or None if the index could
+    not be crawled.
+    """
+    board_path = get_board_path(board_id)
+    store = get_thread_store(board_path)
+    manifest = load_render_manifest(board_path)
+    crawl_queue = queue.Queue(maxsize=queue_size)
+    download_queue = queue.Queue(maxsize=queue_size)
+    render_queue = queue.Queue(maxsize=queue_size)
+    # The board name comes with the first index page; nothing is rendered before it is known.
+    board = {}
+    board_ready = threading.Event()
+    enqueued = set()
+    failed_ids = []
+    rendered = {}
+    lock = threading.Lock()
+
+    def crawl(thread_meta):
+        for attempt in range(CRAWL_ATTEMPTS):
+            if attempt:
+                time.sleep(CRAWL_RETRY_DELAY)
+            try:
+                if crawl_and_save(thread_meta, board_path, mode):
+                    return thread_meta["id"]
+            except Exception as e:
+                logging.exception(f"Unexpected error crawling thread {thread_meta['id']}: {e}")
+        with lock:
+            failed_ids.append(thread_meta["id"])
+        return None
+
+    def download(thread_id):
+        try:
+            process_thread(thread_id, board_path, mode)
+        except Exception as e:
+            # The thread is saved, so it is still rendered, like step 4 does after a failed step 3.
+            logging.exception(f"Failed to download attachments of thread {thread_id}: {e}")
+        return thread_id
+
+    def render(thread_id):
+        board_ready.wait()
+        job = (thread_id, board_path, board["name"], board["template_hash"], manifest.get(thread_id), mode)
+        result = render_pool.submit(render_thread_job, job).result() if render_pool else render_thread_job(job)
+        with lock:
+            rendered[thread_id] = result
+            bar()
+        return thread_id
+
+    def on_board_name(board_name):
+        board["name"] = board_name
+        board["template_hash"] = template_fingerprint(board_name)
+        board_ready.set()
+
+    def on_new_threads(rows):
+        for thread_meta in rows:
+            if mode == 'overwrite' or needs_crawl(thread_meta, store):
+                enqueued.add(thread_meta['id'])
+                crawl_queue.put(thread_meta)  # Blocks while the crawlers are busy.
+
+    own_render_pool = render_pool is None and render_jobs > 1
+    if own_render_pool:
+        render_pool = start_render_pool(render_jobs)
+    stages = [Stage(f'{board_id}-crawl', crawl, workers, crawl_queue,
+                    download_queue if not skip_attachments else render_queue)]
+    if not skip_attachments:
+        stages.append(Stage(f'{board_id}-download', download, download_workers, download_queue, render_queue))
+    stages.append(Stage(f'{board_id}-render', render, render_jobs, render_queue))
+
+    with alive_bar(title=f'Board {board_id}', disable=not show_progress) as bar:
+        for stage in stages:
+            stage.start()
+        try:
+            result = crawl_index(board_id, mode, index_workers, on_board_name, on_new_threads)
+            if result is not None:
+                csv_filepath, _ = result
+                with open(csv_filepath, 'r', encoding='utf-8') as f:
+                    full_thread_list = list(csv.DictReader(f))
+                # Rows kept from the previous index, e.g. threads whose crawl failed last time.
+                for thread_meta in full_thread_list:
+                    if thread_meta['id'] not in enqueued and (mode == 'overwrite' or needs_crawl(thread_meta, store)):
+                        enqueued.add(thread_meta['id'])
+                        crawl_queue.put(thread_meta)
+        finally:
+            board_ready.set()  # So that render workers never wait forever, even if step 1 failed.
+            crawl_queue.put(_DONE)
+            for stage in stages:
+                stage.finish()
+            if own_render_pool:
+                render_pool.shutdown()
+
+    if result is None:
+        return None
+
+    # Threads that did not change keep the page rendered last time, unless the template changed.
+    for thread_meta in full_thread_list:
+        if thread_meta['id'] in rendered:
+            html_filename, manifest_entry = rendered[thread_meta['id']]
+            if manifest_entry:
+                manifest[thread_meta['id']] = manifest_entry
+        else:
+            previous = manifest.get(thread_meta['id'])
+            if (
+                previous
+                and previous.get('template_hash') == board['template_hash']
+                and os.path.exists(os.path.join(board_path, config.HTML_DIR_NAME, 'posts', previous['html_filename']))
+            ):
+                html_filename = previous['html_filename']
+            else:
+                job = (thread_meta['id'], board_path, board['name'], board['template_hash'], previous, mode)
+                html_filename, manifest_entry = render_thread_job(job)
+                if manifest_entry:
+                    manifest[thread_meta['id']] = manifest_entry
+        thread_meta['html_filename'] = html_filename
+
+    save_render_manifest(board_path, manifest)
+    board_url = urljoin(config.BASE_URL, f"thread.php?bid={board_id}")
+    render_indices(full_thread_list, board_path, board['name'], board_url)
+
+    print("\n" + "=" * 25)
+    print(f"--- Pipeline Summary for board {board_id} ---")
+    print(f"Total threads in CSV:   {len(full_thread_list)}")
+    print(f"Crawled:                {stages[0].done}")
+    print(f"Failed to crawl:        {len(failed_ids)}")
+    if failed_ids:
+        print(f"Failed thread IDs: {', '.join(failed_ids)}")
+    print(f"Rendered:               {len(rendered)}")
+    if print_totals:
+        print_process_totals(mode, skip_attachments)
+    print("=" * 25)
+    return {
+        'threads': len(full_thread_list),
+        'crawled': stages[0].done,
+        'failed': len(failed_ids),
+        'rendered': len(rendered),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run steps 1-4 as one streaming pipeline: each thread is crawled, has its attachments "
+                    "downloaded and is rendered as soon as the index lists it."
+    )
+    parser.add_argument("--board_id", type=int, default=config.BOARD_ID, help="The board ID.")
+    parser.add_argument("--mode", type=str, default=config.RUN_MODE, choices=['overwrite', 'update'],
+                        help="Run mode: 'overwrite' or 'update'.")
+    parser.add_argument("--workers", type=int, default=getattr(config, 'THREAD_WORKERS', 1),
+                        help="Number of threads crawled in parallel.")
+    parser.add_argument("--index_workers", type=int, default=getattr(config, 'INDEX_WORKERS', 1),
+                        help="Number of index pages fetched in parallel (overwrite mode only).")
+    parser.add_argument("--download_workers", type=int, default=getattr(config, 'DOWNLOAD_WORKERS', 4),
+                        help="Number of threads whose attachments are downloaded in parallel.")
+    parser.add_argument("--render_jobs", type=int, default=getattr(config, 'RENDER_JOBS', 1),
+                        help="Number of worker processes rendering threads in parallel.")
+    parser.add_argument("--requests_per_second", type=float, default=getattr(config, 'REQUESTS_PER_SECOND', 1.0),
+                        help="Global cap on page requests per second shared by all workers. 0 disables the limit.")
+    parser.add_argument("--queue_size", type=int, default=getattr(config, 'PIPELINE_QUEUE_SIZE', 100),
+                        help="Threads waiting between two stages before the earlier stage pauses.")
+    parser.add_argument("--skip_attachments", action="store_true", help="Don't download attachments.")
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=os.path.join(get_board_path(args.board_id), 'pipeline.log'), filemode='w',
+                        encoding='utf-8', level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(threadName)s %(funcName)s(%(lineno)d) %(message)s')
+    set_request_rate(args.requests_per_second)
+
+    print(f"--- Running the pipeline for board {args.board_id} ---")
+    summary = run_pipeline(
+        args.board_id, args.mode, args.workers, args.index_workers, args.download_workers,
+        args.render_jobs, max(1, args.queue_size), args.skip_attachments,
+    )
+    if summary is None:
+        return 1
+    print("\nPipeline finished.\n")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
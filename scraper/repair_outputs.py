@@ -1,30 +1,16 @@
 import argparse
-import copy
 import csv
-import json
 import logging
 import os
 import sys
 
-from bs4 import BeautifulSoup
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import config
 from scraper.step_2_thread import crawl_thread, extract_inline_images
 from scraper.step_3_download_attachments import download_attachments
-from scraper.step_4_render import render_indices, render_thread_to_html
-from scraper.utils import get_board_path
-
-
-def iter_board_ids(selected_ids=None):
-    if selected_ids:
-        return [str(board_id) for board_id in selected_ids]
-
-    board_ids = []
-    for entry in sorted(os.listdir(config.OUTPUT_DIR)):
-        if entry.isdigit() and os.path.isdir(os.path.join(config.OUTPUT_DIR, entry)):
-            board_ids.append(entry)
-    return board_ids
+from scraper.step_4_render import get_renderer, render_indices, render_thread_to_html
+from scraper.storage import get_thread_store
+from scraper.utils import get_board_path, iter_board_ids, make_soup, parse_board_ids, print_http_cache_stats
 
 
 def load_latest_csv(board_path):
@@ -61,7 +47,7 @@ def normalize_post_inline_images(post, post_index):
     extracted_payloads = set()
 
     if has_legacy_content:
-        wrapper_soup = BeautifulSoup(f"<div>{content}</div>", "html.parser")
+        wrapper_soup = make_soup(f"<div>{content}</div>")
         wrapper = wrapper_soup.div
         extracted_attachments = extract_inline_images(wrapper, post_index)
         if extracted_attachments:
@@ -127,32 +113,25 @@ def normalize_thread_inline_images(thread_data, board_path, write=False):
     return modified, migrated_posts
 
 
-def save_thread_json(thread_data, json_path):
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(thread_data, f, ensure_ascii=False, indent=4)
-
-
 def rebuild_board_html(board_id, board_name, board_rows, board_path):
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
+    store = get_thread_store(board_path)
+    renderer = get_renderer()
 
     for thread_meta in board_rows:
-        json_path = os.path.join(json_dir, f"{thread_meta['id']}.json")
-        if not os.path.exists(json_path):
+        thread_data = store.load(thread_meta["id"])
+        if thread_data is None:
             continue
 
-        with open(json_path, "r", encoding="utf-8") as f:
-            thread_data = json.load(f)
-
-        html_filename = render_thread_to_html(copy.deepcopy(thread_data), board_path, board_name)
+        html_filename = render_thread_to_html(thread_data, board_path, board_name, renderer)
         thread_meta["html_filename"] = html_filename
 
     board_url = f"{config.BASE_URL}thread.php?bid={board_id}"
-    render_indices(board_rows, board_path, board_name, board_url)
+    render_indices(board_rows, board_path, board_name, board_url, renderer)
 
 
 def repair_board(board_id, write=False, migrate_inline=True, repair_urls=True, rebuild_html=True):
     board_path = get_board_path(board_id)
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
+    store = get_thread_store(board_path)
     csv_path, board_name, board_rows = load_latest_csv(board_path)
 
     result = {
@@ -167,20 +146,18 @@ def repair_board(board_id, write=False, migrate_inline=True, repair_urls=True, r
         "changed": False,
     }
 
-    if not os.path.isdir(json_dir):
+    thread_ids = store.iter_ids()
+    if not thread_ids:
         return result
 
-    json_files = sorted([f for f in os.listdir(json_dir) if f.endswith(".json")])
-    result["json_files"] = len(json_files)
+    result["json_files"] = len(thread_ids)
 
     if migrate_inline:
-        for json_filename in json_files:
-            json_path = os.path.join(json_dir, json_filename)
+        for thread_id in thread_ids:
             try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    thread_data = json.load(f)
+                thread_data = store.load(thread_id)
             except Exception as exc:
-                logging.warning(f"Failed to load {json_path}: {exc}")
+                logging.warning(f"Failed to load thread {thread_id} from {store.location}: {exc}")
                 continue
 
             modified, migrated_posts = normalize_thread_inline_images(
@@ -193,21 +170,19 @@ def repair_board(board_id, write=False, migrate_inline=True, repair_urls=True, r
             result["inline_posts_changed"] += migrated_posts
             result["changed"] = True
             if write:
-                save_thread_json(thread_data, json_path)
+                store.save(thread_data)
 
     if repair_urls and board_rows:
         for row in board_rows:
             row_id = row["id"]
-            json_path = os.path.join(json_dir, f"{row_id}.json")
 
-            if not os.path.exists(json_path):
+            if not store.exists(row_id):
                 result["missing_json"] += 1
                 needs_recrawl = True
                 existing_json = None
             else:
                 try:
-                    with open(json_path, "r", encoding="utf-8") as f:
-                        existing_json = json.load(f)
+                    existing_json = store.load(row_id)
                 except Exception:
                     result["missing_json"] += 1
                     needs_recrawl = True
@@ -237,7 +212,7 @@ def repair_board(board_id, write=False, migrate_inline=True, repair_urls=True, r
             attachment_modified = download_attachments(thread_data, board_path, "update")
             if attachment_modified:
                 logging.info(f"Downloaded attachments while recrawling board {board_id} thread {row_id}")
-            save_thread_json(thread_data, json_path)
+            store.save(thread_data)
 
     if write and rebuild_html and result["changed"] and board_rows:
         rebuild_board_html(board_id, board_name, board_rows, board_path)
@@ -245,12 +220,6 @@ def repair_board(board_id, write=False, migrate_inline=True, repair_urls=True, r
     return result
 
 
-def parse_board_ids(raw_board_ids):
-    if not raw_board_ids:
-        return None
-    return [board_id.strip() for board_id in raw_board_ids.split(",") if board_id.strip()]
-
-
 def main():
     parser = argparse.ArgumentParser(
         description="Repair legacy inline images and JSON/CSV URL mismatches in scraped output."
@@ -317,6 +286,7 @@ def main():
             result["recrawled_threads"],
             int(result["changed"]),
         )
+    print_http_cache_stats()
 
 
 if __name__ == "__main__":
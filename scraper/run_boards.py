@@ -0,0 +1,122 @@
+# scraper/run_boards.py
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from scraper.pipeline import print_process_totals, run_pipeline, start_render_pool
+from scraper.utils import iter_board_ids, login, parse_board_ids, set_request_rate
+
+
+def select_board_ids(raw_board_ids=None, all_boards=False):
+    """Boards to run: --board_ids, every board already under OUTPUT_DIR, config.BOARD_IDS, or config.BOARD_ID."""
+    if raw_board_ids:
+        return iter_board_ids(parse_board_ids(raw_board_ids))
+    if all_boards:
+        return iter_board_ids()
+    return iter_board_ids(getattr(config, 'BOARD_IDS', None) or [config.BOARD_ID])
+
+
+def run_board(board_id, args, workers, download_workers, render_pool):
+    """Runs the pipeline for one board. Returns (board_id, summary or None, seconds)."""
+    started = time.perf_counter()
+    try:
+        summary = run_pipeline(
+            board_id, args.mode, workers, args.index_workers, download_workers, args.render_jobs,
+            max(1, args.queue_size), args.skip_attachments, render_pool=render_pool, show_progress=False,
+            print_totals=False,
+        )
+    except Exception as e:
+        # One broken board must not stop the others.
+        logging.exception(f"Board {board_id} failed: {e}")
+        print(f"Board {board_id} failed: {e}")
+        summary = None
+    return board_id, summary, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the pipeline for several boards in one process, sharing the login, "
+                    "the connection pool and the request rate limit."
+    )
+    parser.add_argument("--board_ids", type=str,
+                        help="Comma-separated board IDs. Defaults to config.BOARD_IDS, or config.BOARD_ID.")
+    parser.add_argument("--all_boards", action="store_true",
+                        help="Run every board that already has an output folder.")
+    parser.add_argument("--mode", type=str, default=config.RUN_MODE, choices=['overwrite', 'update'],
+                        help="Run mode: 'overwrite' or 'update'.")
+    parser.add_argument("--parallel_boards", type=int, default=getattr(config, 'PARALLEL_BOARDS', 2),
+                        help="Number of boards worked on at the same time.")
+    parser.add_argument("--workers", type=int, default=getattr(config, 'THREAD_WORKERS', 1),
+                        help="Threads crawled in parallel in total, split evenly between the boards running.")
+    parser.add_argument("--index_workers", type=int, default=getattr(config, 'INDEX_WORKERS', 1),
+                        help="Number of index pages fetched in parallel per board (overwrite mode only).")
+    parser.add_argument("--download_workers", type=int, default=getattr(config, 'DOWNLOAD_WORKERS', 4),
+                        help="Attachment download workers in total, split evenly between the boards running.")
+    parser.add_argument("--render_jobs", type=int, default=getattr(config, 'RENDER_JOBS', 1),
+                        help="Number of worker processes rendering threads, shared by all boards.")
+    parser.add_argument("--requests_per_second", type=float, default=getattr(config, 'REQUESTS_PER_SECOND', 1.0),
+                        help="Global cap on page requests per second shared by all boards. 0 disables the limit.")
+    parser.add_argument("--queue_size", type=int, default=getattr(config, 'PIPELINE_QUEUE_SIZE', 100),
+                        help="Threads waiting between two stages of a board before the earlier stage pauses.")
+    parser.add_argument("--skip_attachments", action="store_true", help="Don't download attachments.")
+    args = parser.parse_args()
+
+    board_ids = select_board_ids(args.board_ids, args.all_boards)
+    if not board_ids:
+        print(f"No boards to run. Pass --board_ids or set BOARD_IDS in config.py.")
+        return 1
+
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(config.OUTPUT_DIR, 'run_boards.log'), filemode='w',
+                        encoding='utf-8', level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(threadName)s %(funcName)s(%(lineno)d) %(message)s')
+    set_request_rate(args.requests_per_second)
+
+    parallel_boards = max(1, min(args.parallel_boards, len(board_ids)))
+    # Every board running gets the same share of the workers, and all of them queue for the same
+    # rate limiter tokens in turn, so a large board can't starve a small one.
+    workers = max(1, args.workers // parallel_boards)
+    download_workers = max(1, args.download_workers // parallel_boards)
+    print(f"--- Running {len(board_ids)} boards, {parallel_boards} at a time, "
+          f"{workers} crawl worker(s) each ---")
+
+    # Render processes are forked before any thread starts, and shared by all boards.
+    render_pool = start_render_pool(args.render_jobs) if args.render_jobs > 1 else None
+    try:
+        # Log in once up front; every board then reuses the same session and cookies.
+        login()
+        with ThreadPoolExecutor(max_workers=parallel_boards, thread_name_prefix='board') as executor:
+            results = list(executor.map(
+                lambda board_id: run_board(board_id, args, workers, download_workers, render_pool), board_ids
+            ))
+    finally:
+        if render_pool:
+            render_pool.shutdown()
+
+    print("\n" + "=" * 25)
+    print("--- Boards Summary ---")
+    print(f"{'board':>8} {'threads':>8} {'crawled':>8} {'failed':>7} {'seconds':>8}")
+    failed_boards = []
+    for board_id, summary, seconds in results:
+        if summary is None:
+            failed_boards.append(board_id)
+            print(f"{board_id:>8} {'failed':>8} {'':>8} {'':>7} {seconds:8.1f}")
+        else:
+            print(f"{board_id:>8} {summary['threads']:>8} {summary['crawled']:>8} {summary['failed']:>7} "
+                  f"{seconds:8.1f}")
+    # Counters shared by all boards are printed once, here, rather than in each board's summary.
+    print_process_totals(args.mode, args.skip_attachments)
+    print("=" * 25)
+    if failed_boards:
+        print(f"\nFailed boards: {', '.join(failed_boards)}\n")
+        return 1
+    print("\nAll boards finished.\n")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
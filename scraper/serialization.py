@@ -0,0 +1,70 @@
+# scraper/serialization.py
+import json
+import os
+import sys
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+
+# Read once at import, while no other thread can create files: reading the umask means setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def dumps(obj, compact=None, sort_keys=False):
+    """Serializes obj to UTF-8 JSON bytes.
+
+    Indented output always comes from the standard library, so files are byte-for-byte
+    the same with or without orjson. Compact output (config.JSON_COMPACT by default)
+    uses orjson when it is installed.
+    """
+    if compact is None:
+        compact = getattr(config, "JSON_COMPACT", False)
+    if not compact:
+        return json.dumps(obj, ensure_ascii=False, indent=4, sort_keys=sort_keys).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys).encode("utf-8")
+
+
+def loads(data):
+    """Parses JSON from bytes or str, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def set_default_mode(path):
+    """Gives a file made by tempfile.mkstemp (always 0600) the mode open() would have given it."""
+    os.chmod(path, 0o666 & ~_UMASK)
+
+
+def write_atomic(path, data):
+    """Writes bytes to path via a temp file and rename, so a crash never leaves a truncated file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        set_default_mode(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def dump_file(path, obj, compact=None):
+    """Atomically writes obj as JSON to path. Returns the bytes written."""
+    data = dumps(obj, compact)
+    write_atomic(path, data)
+    return data
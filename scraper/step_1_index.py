@@ -4,13 +4,21 @@ import csv
 import os
 import re
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import urljoin
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import config
-from scraper.utils import get_soup, get_board_path
+from scraper.utils import (
+    get_soup,
+    get_board_path,
+    get_total_pages,
+    print_http_cache_stats,
+    print_rate_stats,
+    print_session_stats,
+    set_request_rate,
+)
 
 
 def normalize_date(date_str):
@@ -71,35 +79,180 @@ def get_board_name(soup):
     return "unknown"
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Step 1: Crawl a BBS board index and save thread metadata to a CSV."
-    )
-    parser.add_argument(
-        "--board_id",
-        type=int,
-        default=config.BOARD_ID,
-        help="The ID of the board to scrape.",
-    )
-    parser.add_argument(
-        "--mode",
-        type=str,
-        default=config.RUN_MODE,
-        choices=["overwrite", "update"],
-        help="Run mode: 'overwrite' or 'update'.",
+def get_index_url(board_id, page_num):
+    """Builds the URL of one page of a board's topic index."""
+    return urljoin(
+        config.BASE_URL, f"thread.php?bid={board_id}&mode=topic&page={page_num}"
     )
-    args = parser.parse_args()
 
-    print(f"--- Running Step 1: Crawl Board Index for board {args.board_id} ---")
 
+def parse_index_page(page_soup, page_num, last_update_time=None):
+    """Parses the thread list of one index page.
+
+    Returns (threads, stop_crawling). In update mode, pass last_update_time so
+    parsing stops at the first thread last replied before that day.
+    """
+    threads = []
+    for item in page_soup.select("div.list-item-topic"):
+        try:
+            authors = item.select("div.author")
+            if not authors:
+                continue
+
+            last_reply_div = authors[1] if len(authors) > 1 else authors[0]
+
+            # Normalize dates
+            raw_post_date = authors[0].select_one(".time").text.strip()
+            post_date = normalize_date(raw_post_date)
+            raw_last_reply_date = last_reply_div.select_one(".time").text.strip()
+            last_reply_date = normalize_date(raw_last_reply_date)
+
+            if last_update_time:
+                current_reply_dt = datetime.strptime(last_reply_date, "%Y-%m-%d")
+                if (
+                    current_reply_dt.date() < last_update_time.date()
+                ):  # Changed from <= to <
+                    return threads, True
+
+            title_link = item.find("a", class_="link", href=True)
+            id_div = item.select_one("div.id.l")
+            if not id_div or not id_div.text.strip().isdigit():
+                continue
+            thread_id = id_div.text.strip()
+
+            threads.append(
+                {
+                    "id": thread_id,
+                    "url": urljoin(config.BASE_URL, title_link["href"]),
+                    "title": item.select_one("div.title").text.strip(),
+                    "author": authors[0].select_one(".name").text.strip(),
+                    "post_date": post_date,
+                    "replies": (
+                        item.select_one("div.reply-num").text.strip()
+                        if item.select_one("div.reply-num")
+                        else "0"
+                    ),
+                    "last_reply_author": last_reply_div.select_one(
+                        ".name"
+                    ).text.strip(),
+                    "last_reply_date": last_reply_date,
+                }
+            )
+
+        except Exception as e:
+            print(f"Error parsing a thread item on page {page_num}: {e}")
+            continue
+
+    return threads, False
+
+
+def fetch_and_parse_index_page(board_id, page_num):
+    """Fetches and parses one index page. Returns None if the page is unusable."""
+    page_soup = get_soup(get_index_url(board_id, page_num))
+    if not page_soup or page_soup.find("div", class_="error-page"):
+        return None
+    threads, _ = parse_index_page(page_soup, page_num)
+    return threads
+
+
+def crawl_index_pages_parallel(board_id, first_page_threads, total_pages, workers):
+    """Fetches index pages 2..total_pages concurrently and returns the threads of each page in order."""
+    page_nums = list(range(2, total_pages + 1))
+    print(f"Fetching {len(page_nums)} more index pages with {workers} workers.")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(
+            zip(
+                page_nums,
+                executor.map(
+                    lambda page_num: fetch_and_parse_index_page(board_id, page_num),
+                    page_nums,
+                ),
+            )
+        )
+
+    # Give the pages that failed one more serial chance before reporting them.
+    for page_num in [n for n in page_nums if results[n] is None]:
+        print(f"Retrying index page {page_num}.")
+        results[page_num] = fetch_and_parse_index_page(board_id, page_num)
+
+    failed_pages = [n for n in page_nums if results[n] is None]
+    if failed_pages:
+        print(f"Warning: Could not fetch index pages {failed_pages}. Their threads are missing.")
+
+    pages = [(1, first_page_threads)]
+    pages.extend((n, results[n]) for n in page_nums if results[n] is not None)
+    return pages
+
+
+def write_new_threads(writer, page_threads, newly_crawled_threads, on_new_threads=None):
+    """Writes threads not seen on earlier pages to the CSV. Returns how many were written.
+
+    on_new_threads, if given, is called with the rows written, as soon as they are.
+    """
+    new_threads = []
+    for thread_info in page_threads:
+        if thread_info["id"] not in newly_crawled_threads:
+            writer.writerow(thread_info)
+            newly_crawled_threads[thread_info["id"]] = thread_info
+            new_threads.append(thread_info)
+    if on_new_threads and new_threads:
+        on_new_threads(new_threads)
+    return len(new_threads)
+
+
+def crawl_index_pages_serial(board_id, first_page_soup, writer, newly_crawled_threads, last_update_time=None,
+                             on_new_threads=None):
+    """Walks index pages one by one until the last page or the last update date."""
+    page_num = 1
+    while True:
+        index_url = get_index_url(board_id, page_num)
+        print(f"Crawling index page: {index_url}")
+
+        # Re-use soup for first page
+        page_soup = first_page_soup if page_num == 1 else get_soup(index_url)
+
+        if not page_soup or page_soup.find("div", class_="error-page"):
+            print("Could not fetch page or error page found.")
+            break
+
+        if not page_soup.select("div.list-item-topic"):
+            print("No more list items found.")
+            break
+
+        page_threads, stop_crawling = parse_index_page(page_soup, page_num, last_update_time)
+        page_threads_found = write_new_threads(writer, page_threads, newly_crawled_threads, on_new_threads)
+
+        print(
+            f"Found and wrote {page_threads_found} new threads from page {page_num}."
+        )
+        if stop_crawling:
+            print("Reached last update date. Stopping crawl.")
+            break
+
+        next_page_div = page_soup.select_one(
+            'div.paging-button:-soup-contains("下一页")'
+        )
+        if not (next_page_div and next_page_div.find("a")):
+            print("Last page reached.")
+            break
+
+        page_num += 1
+
+
+def crawl_index(board_id, mode, workers=1, on_board_name=None, on_new_threads=None):
+    """Crawls a board's topic index into a new CSV, merged with the previous one in update mode.
+
+    on_board_name, if given, is called with the board name once the first page is read, and
+    on_new_threads with each batch of thread rows as they are written, before the whole index
+    is done. Returns (CSV path, board name), or None on failure.
+    """
     # Initial page fetch just to get board name
-    initial_url = urljoin(
-        config.BASE_URL, f"thread.php?bid={args.board_id}&mode=topic&page=1"
-    )
+    initial_url = get_index_url(board_id, 1)
     soup = get_soup(initial_url)
     if not soup:
-        print(f"Failed to fetch initial page for board {args.board_id}. Exiting.")
-        return 1
+        print(f"Failed to fetch initial page for board {board_id}. Exiting.")
+        return None
 
     board_name = get_board_name(soup)
     if board_name == "unknown":
@@ -110,16 +263,18 @@ def main():
         print(
             "Please check your network settings and the board ID in config.py, then try again."
         )
-        return 1
+        return None
 
-    board_path = get_board_path(args.board_id)
-    print(f"Scraping board: {board_name} (ID: {args.board_id})")
+    board_path = get_board_path(board_id)
+    print(f"Scraping board: {board_name} (ID: {board_id})")
+    if on_board_name:
+        on_board_name(board_name)
 
     # --- Merged Crawl and Save Logic ---
 
     existing_csv_file = None
     last_update_time = None
-    if args.mode == "update":
+    if mode == "update":
         try:
             csv_files = [f for f in os.listdir(board_path) if f.endswith(".csv")]
             if csv_files:
@@ -139,10 +294,10 @@ def main():
             print(
                 f"Could not determine last update date: {e}. Defaulting to overwrite."
             )
-            args.mode = "overwrite"
+            mode = "overwrite"
 
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    new_csv_filename = f"{args.board_id}_{board_name}_{timestamp}.csv"
+    new_csv_filename = f"{board_id}_{board_name}_{timestamp}.csv"
     new_csv_filepath = os.path.join(board_path, new_csv_filename)
 
     fieldnames = [
@@ -161,105 +316,29 @@ def main():
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
 
-        page_num = 1
-        stop_crawling = False
-        while True:
-            index_url = urljoin(
-                config.BASE_URL,
-                f"thread.php?bid={args.board_id}&mode=topic&page={page_num}",
+        total_pages = get_total_pages(soup)
+        if mode == "overwrite" and workers > 1 and total_pages > 1:
+            print(f"Board index has {total_pages} pages.")
+            first_page_threads, _ = parse_index_page(soup, 1)
+            pages = crawl_index_pages_parallel(
+                board_id, first_page_threads, total_pages, workers
             )
-            print(f"Crawling index page: {index_url}")
-
-            # Re-use soup for first page
-            page_soup = soup if page_num == 1 else get_soup(index_url)
-
-            if not page_soup or page_soup.find("div", class_="error-page"):
-                print("Could not fetch page or error page found.")
-                break
-
-            list_items = page_soup.select("div.list-item-topic")
-            if not list_items:
-                print("No more list items found.")
-                break
-
-            page_threads_found = 0
-            for item in list_items:
-                try:
-                    authors = item.select("div.author")
-                    if not authors:
-                        continue
-
-                    last_reply_div = authors[1] if len(authors) > 1 else authors[0]
-
-                    # Normalize dates
-                    raw_post_date = authors[0].select_one(".time").text.strip()
-                    post_date = normalize_date(raw_post_date)
-                    raw_last_reply_date = last_reply_div.select_one(
-                        ".time"
-                    ).text.strip()
-                    last_reply_date = normalize_date(raw_last_reply_date)
-
-                    if args.mode == "update" and last_update_time:
-                        current_reply_dt = datetime.strptime(
-                            last_reply_date, "%Y-%m-%d"
-                        )
-                        if (
-                            current_reply_dt.date() < last_update_time.date()
-                        ):  # Changed from <= to <
-                            stop_crawling = True
-                            break
-
-                    title_link = item.find("a", class_="link", href=True)
-                    id_div = item.select_one("div.id.l")
-                    if not id_div or not id_div.text.strip().isdigit():
-                        continue
-                    thread_id = id_div.text.strip()
-
-                    thread_info = {
-                        "id": thread_id,
-                        "url": urljoin(config.BASE_URL, title_link["href"]),
-                        "title": item.select_one("div.title").text.strip(),
-                        "author": authors[0].select_one(".name").text.strip(),
-                        "post_date": post_date,
-                        "replies": (
-                            item.select_one("div.reply-num").text.strip()
-                            if item.select_one("div.reply-num")
-                            else "0"
-                        ),
-                        "last_reply_author": last_reply_div.select_one(
-                            ".name"
-                        ).text.strip(),
-                        "last_reply_date": last_reply_date,
-                    }
-
-                    if thread_id not in newly_crawled_threads:
-                        writer.writerow(thread_info)
-                        newly_crawled_threads[thread_id] = thread_info
-                        page_threads_found += 1
-
-                except Exception as e:
-                    print(f"Error parsing a thread item on page {page_num}: {e}")
-                    continue
-
-            print(
-                f"Found and wrote {page_threads_found} new threads from page {page_num}."
-            )
-            if stop_crawling:
-                print("Reached last update date. Stopping crawl.")
-                break
-
-            next_page_div = page_soup.select_one(
-                'div.paging-button:-soup-contains("下一页")'
+            # Deduplicate in page order, as threads can shift between pages during the crawl.
+            for page_num, page_threads in pages:
+                page_threads_found = write_new_threads(
+                    writer, page_threads, newly_crawled_threads, on_new_threads
+                )
+                print(
+                    f"Found and wrote {page_threads_found} new threads from page {page_num}."
+                )
+        else:
+            crawl_index_pages_serial(
+                board_id, soup, writer, newly_crawled_threads,
+                last_update_time if mode == "update" else None, on_new_threads,
             )
-            if not (next_page_div and next_page_div.find("a")):
-                print("Last page reached.")
-                break
-
-            page_num += 1
-            time.sleep(1)
 
     # In update mode, merge old data
-    if args.mode == "update" and existing_csv_file:
+    if mode == "update" and existing_csv_file:
         print(f"Merging with old data from {existing_csv_file}")
         with open(existing_csv_file, "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
@@ -280,6 +359,52 @@ def main():
 
         os.remove(existing_csv_file)
 
+    return new_csv_filepath, board_name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Step 1: Crawl a BBS board index and save thread metadata to a CSV."
+    )
+    parser.add_argument(
+        "--board_id",
+        type=int,
+        default=config.BOARD_ID,
+        help="The ID of the board to scrape.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default=config.RUN_MODE,
+        choices=["overwrite", "update"],
+        help="Run mode: 'overwrite' or 'update'.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=getattr(config, "INDEX_WORKERS", 1),
+        help="Number of index pages fetched in parallel (overwrite mode only).",
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        type=float,
+        default=getattr(config, "REQUESTS_PER_SECOND", 1.0),
+        help="Global cap on page requests per second shared by all workers. 0 disables the limit.",
+    )
+    args = parser.parse_args()
+
+    set_request_rate(args.requests_per_second)
+
+    print(f"--- Running Step 1: Crawl Board Index for board {args.board_id} ---")
+
+    result = crawl_index(args.board_id, args.mode, args.workers)
+    if result is None:
+        return 1
+    new_csv_filepath, _ = result
+
+    print_http_cache_stats()
+    print_rate_stats()
+    print_session_stats()
     print(f"\nStep 1 finished successfully. Final CSV saved to: {new_csv_filepath}\n")
 
 
@@ -1,22 +1,44 @@
 # scraper/step_2_thread.py
 import argparse
 from alive_progress import alive_bar
+import base64
 import csv
 import hashlib
+import heapq
 import json
 import logging
 import os
 import re
 import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from urllib.parse import urljoin, urlparse, parse_qs, urlencode
 
-from bs4 import BeautifulSoup, Tag
+from bs4 import Tag
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import config
-from scraper.utils import get_soup, get_board_path, reset_session
+from scraper.utils import (
+    count_session_event,
+    get_board_path,
+    get_page_text,
+    get_total_pages,
+    invalidate_cached_page,
+    is_login_page_text,
+    make_soup,
+    get_rate_limiter,
+    print_http_cache_stats,
+    print_rate_stats,
+    print_session_stats,
+    record_suspicious_page,
+    reset_session,
+    set_request_rate,
+)
+from scraper.step_3_download_attachments import make_inline_sink
+from scraper.storage import get_crawl_frontier, get_page_fingerprints, get_thread_store
 
 
 THREAD_PAGE_TIMEOUT = getattr(config, "THREAD_PAGE_TIMEOUT", 180)
@@ -24,6 +46,18 @@ THREAD_PAGE_RETRIES = getattr(config, "THREAD_PAGE_RETRIES", 4)
 THREAD_PAGE_RETRY_DELAYS = tuple(
     getattr(config, "THREAD_PAGE_RETRY_DELAYS", (0, 5, 15, 30))
 )
+THREAD_POSTS_PER_PAGE = getattr(config, "THREAD_POSTS_PER_PAGE", 30)
+# Threads that fail wait CRAWL_RETRY_BASE_DELAY * 2 ** (failures - 1) seconds, at most
+# CRAWL_RETRY_MAX_DELAY, before the next attempt. Retries due within CRAWL_RETRY_WAIT are
+# waited for in the same run; later ones are left to the next run.
+CRAWL_RETRY_BASE_DELAY = getattr(config, "CRAWL_RETRY_BASE_DELAY", 5)
+CRAWL_RETRY_MAX_DELAY = getattr(config, "CRAWL_RETRY_MAX_DELAY", 86400)
+CRAWL_RETRY_WAIT = getattr(config, "CRAWL_RETRY_WAIT", 30)
+UNFINISHED_STATES = ("pending", "in_progress")
+
+# Counts for the summary of update runs, shared by the worker threads.
+_update_stats = Counter()
+_update_stats_lock = threading.Lock()
 
 
 def get_url_thread_id(url):
@@ -66,13 +100,54 @@ def is_thread_page_complete(soup, expected_page_thread_id):
     return True, None
 
 
+def is_thread_page_cut_off(html, soup):
+    """Tells whether a thread page was cut off before its end.
+
+    A page that ends in </html> is whole. Without it, a thread with several pages needs the paging
+    bar below its posts, and a single-page thread a full page of posts, to count as whole.
+    """
+    if "</html" in html[-4096:].lower():
+        return False
+    cards = soup.select("div.post-card")
+    if soup.select_one("div.paging"):
+        return not (cards and cards[-1].find_next("div", class_="paging"))
+    return len(cards) < THREAD_POSTS_PER_PAGE
+
+
+def check_thread_page(html, expected_page_thread_id):
+    """Parses a fetched thread page and says what, if anything, is wrong with it.
+
+    Returns (soup, kind, reason). kind is None for a good page, "error" if the request failed,
+    "login" for the login form, "truncated" for a page cut off before its end, "mismatch" for
+    another thread's page and "incomplete" if the page lacks the parts of a thread page.
+    """
+    if html is None:
+        return None, "error", "request failed"
+    if is_login_page_text(html):
+        return None, "login", "login page"
+    soup = make_soup(html)
+    # A page cut off mid-way can still hold a few whole post cards, so look for its end.
+    if is_thread_page_cut_off(html, soup):
+        return soup, "truncated", "page cut off before its end"
+    is_complete, reason = is_thread_page_complete(soup, expected_page_thread_id)
+    if not is_complete:
+        return soup, "mismatch" if reason.startswith("thread id mismatch") else "incomplete", reason
+    return soup, None, None
+
+
 def fetch_thread_soup(page_url, expected_page_thread_id):
-    """Fetches a thread page with local retries and session reset on suspicious results."""
+    """Fetches a thread page with local retries, dealing with each kind of bad page on its own terms.
+
+    Only a login page leads to a new login (in fetch(), once for all threads that meet it);
+    another thread's page drops the pooled connections but keeps the login; truncated or
+    incomplete pages and failed requests are just fetched again.
+    """
     last_reason = "unknown"
 
     for attempt in range(THREAD_PAGE_RETRIES):
         delay = THREAD_PAGE_RETRY_DELAYS[min(attempt, len(THREAD_PAGE_RETRY_DELAYS) - 1)]
-        if delay:
+        # An adaptive rate limiter has already slowed down after the bad page, so don't wait twice.
+        if delay and not get_rate_limiter().adaptive:
             time.sleep(delay)
 
         if attempt > 0:
@@ -80,20 +155,58 @@ def fetch_thread_soup(page_url, expected_page_thread_id):
                 f"Retrying thread page fetch ({attempt + 1}/{THREAD_PAGE_RETRIES}) for {page_url}."
             )
 
-        soup = get_soup(page_url, timeout=THREAD_PAGE_TIMEOUT)
-        is_complete, reason = is_thread_page_complete(soup, expected_page_thread_id)
-        if is_complete:
+        html = get_page_text(page_url, timeout=THREAD_PAGE_TIMEOUT)
+        soup, kind, reason = check_thread_page(html, expected_page_thread_id)
+        if kind is None:
             return soup
 
-        last_reason = reason or "page validation failed"
-        logging.warning(f"Suspicious thread page for {page_url}: {last_reason}")
-        reset_session(clear_login=True)
+        last_reason = reason
+        logging.warning(f"Suspicious thread page for {page_url} ({kind}): {reason}")
+        count_session_event(f"{kind} page")
+        invalidate_cached_page(page_url)
+        # fetch() has already logged in again on a login page, and told the rate limiter about
+        # failed requests, so the retry is all those need.
+        if kind not in ("login", "error"):
+            record_suspicious_page()
+            if kind == "mismatch":
+                reset_session()
 
     logging.error(f"Failed to fetch a valid thread page for {page_url}: {last_reason}")
     return None
 
 
-def extract_inline_images(content_element, post_index):
+def _inline_image_attachment(img_src, post_index, inline_index, inline_sink):
+    """Decodes one data:image URL and returns its attachment dict.
+
+    With an inline_sink the image is written out right away and only its name,
+    hash and size go into the JSON; otherwise, or if writing it fails, the base64
+    payload is kept for step 3.
+    """
+    match = re.match(r"data:image/([a-zA-Z0-9.+-]+);base64,", img_src)
+    file_ext = (match.group(1) if match else "png").split("+", 1)[0].lower()
+    try:
+        data = base64.b64decode(img_src.split(",", 1)[1])
+    except (IndexError, ValueError) as e:
+        logging.warning(f"Could not decode inline image {inline_index} of post {post_index}: {e}")
+        payload_hash = hashlib.sha1(img_src.encode("utf-8")).hexdigest()[:10]
+        filename = f"inline_p{post_index}_{inline_index}_{payload_hash}.{file_ext}"
+        return {"type": "base64", "data": img_src, "filename": filename}
+
+    digest = hashlib.sha256(data).hexdigest()
+    filename = f"inline_p{post_index}_{inline_index}_{digest[:10]}.{file_ext}"
+    if inline_sink is None:
+        return {"type": "base64", "data": img_src, "filename": filename}
+
+    try:
+        inline_sink.save(filename, data)
+    except Exception as e:
+        # E.g. a full disk or a locked blob index. Keep the payload in the JSON so step 3 can save it later.
+        logging.error(f"Could not save inline image {filename} of post {post_index}: {e}")
+        return {"type": "base64", "data": img_src, "filename": filename}
+    return {"type": "inline_file", "filename": filename, "saved": True, "sha256": digest, "size": len(data)}
+
+
+def extract_inline_images(content_element, post_index, inline_sink=None):
     """Moves base64 inline image payloads out of the HTML body."""
     attachments = []
     inline_index = 1
@@ -103,15 +216,10 @@ def extract_inline_images(content_element, post_index):
         if not img_src or not img_src.startswith("data:image"):
             continue
 
-        match = re.match(r"data:image/([a-zA-Z0-9.+-]+);base64,", img_src)
-        file_ext = (match.group(1) if match else "png").split("+", 1)[0].lower()
-        payload_hash = hashlib.sha1(img_src.encode("utf-8")).hexdigest()[:10]
-        filename = f"inline_p{post_index}_{inline_index}_{payload_hash}.{file_ext}"
-
-        attachments.append({"type": "base64", "data": img_src, "filename": filename})
-        placeholder = BeautifulSoup(
-            f'<p class="inline-image-placeholder">[内嵌图片已保存为附件：{filename}]</p>',
-            "html.parser",
+        attachment = _inline_image_attachment(img_src, post_index, inline_index, inline_sink)
+        attachments.append(attachment)
+        placeholder = make_soup(
+            f'<p class="inline-image-placeholder">[内嵌图片已保存为附件：{attachment["filename"]}]</p>'
         ).p
         img.replace_with(placeholder)
         inline_index += 1
@@ -119,7 +227,7 @@ def extract_inline_images(content_element, post_index):
     return attachments
 
 
-def parse_post(post_element, base_url, post_index=0):
+def parse_post(post_element, base_url, post_index=0, inline_sink=None):
     """Parses a single post element and returns a dictionary of its data."""
     post_data = {"post_time": "N/A", "edit_time": "N/A"}
     try:
@@ -163,7 +271,7 @@ def parse_post(post_element, base_url, post_index=0):
         if not content_element:
             return None
 
-        attachments = extract_inline_images(content_element, post_index)
+        attachments = extract_inline_images(content_element, post_index, inline_sink)
         quotes = []
         body_content_parts = []
         all_children = list(content_element.children)
@@ -246,8 +354,60 @@ def parse_post(post_element, base_url, post_index=0):
     return post_data
 
 
-def crawl_thread(thread_url, thread_id):
-    """Crawls a single thread, handling multiple pages by constructing page URLs."""
+def thread_page_url(thread_url, page_num):
+    """Builds the URL of one page of a thread from its first-page URL."""
+    parts = urlparse(thread_url)
+    query_dict = parse_qs(parts.query)
+    query_dict["page"] = [str(page_num)]
+    return parts._replace(query=urlencode(query_dict, doseq=True)).geturl()
+
+
+def _card_text(element):
+    return " ".join(element.get_text(" ", strip=True).split()) if element else ""
+
+
+def page_fingerprint(soup):
+    """Hashes the normalized post cards of a thread page.
+
+    Covers each card's floor, author, post and edit times, body text, image sources and
+    attachment links, so editing a post changes the fingerprint of its page while
+    whitespace and markup around the cards do not.
+    """
+    digest = hashlib.sha1()
+    for card in soup.select("div.post-card"):
+        parts = [
+            _card_text(card.select_one("span.post-id")),
+            _card_text(card.select_one("p.username a")),
+            _card_text(card.select_one("div.sl-triangle-container")),
+            _card_text(card.select_one("div.content div.body")),
+        ]
+        parts.extend(img.get("src", "") for img in card.select("div.content div.body img"))
+        parts.extend(link.get("href", "") for link in card.select("div.attachment li a"))
+        digest.update("\x1f".join(parts).encode("utf-8") + b"\x1e")
+    return digest.hexdigest()
+
+
+def parse_page_posts(soup, page_num, posts, inline_sink=None, fingerprints=None):
+    """Parses the post cards of one thread page onto posts, recording the page each post came from.
+
+    If fingerprints is a dict, the page's fingerprint is stored in it under page_num.
+    """
+    if fingerprints is not None:
+        # Before parsing, which replaces inline images with placeholders.
+        fingerprints[page_num] = page_fingerprint(soup)
+    for post_element in soup.select("div.post-card"):
+        post_content = parse_post(post_element, config.BASE_URL, len(posts) + 1, inline_sink)
+        if post_content:
+            post_content["page"] = page_num
+            posts.append(post_content)
+
+
+def crawl_thread(thread_url, thread_id, inline_sink=None, fingerprints=None):
+    """Crawls a single thread, handling multiple pages by constructing page URLs.
+
+    Inline images are written through inline_sink as they are parsed, if one is given,
+    and page fingerprints are collected into the fingerprints dict, if one is given.
+    """
     thread_data = {"posts": []}
     expected_page_thread_id = get_url_thread_id(thread_url)
 
@@ -267,34 +427,17 @@ def crawl_thread(thread_url, thread_id):
         thread_data["url"] = thread_url
 
     # Parse posts on first page
-    for post_element in soup.select("div.post-card"):
-        post_content = parse_post(
-            post_element, config.BASE_URL, len(thread_data["posts"]) + 1
-        )
-        if post_content:
-            thread_data["posts"].append(post_content)
+    parse_page_posts(soup, 1, thread_data["posts"], inline_sink, fingerprints)
 
     # Determine total number of pages
-    total_pages = 1
-    if paging_div := soup.select_one("div.paging"):
-        total_pages_elem = paging_div.find(string=re.compile(r"/\s*\d+"))
-        if total_pages_elem:
-            try:
-                total_pages = int(total_pages_elem.strip().replace("/", "").strip())
-            except (ValueError, AttributeError):
-                pass
+    total_pages = get_total_pages(soup)
 
     if total_pages <= 1:
         return thread_data
 
     # --- Subsequent pages ---
-    parts = urlparse(thread_url)
-    query_dict = parse_qs(parts.query)
-
     for page_num in range(2, total_pages + 1):
-        query_dict["page"] = [str(page_num)]
-        new_query = urlencode(query_dict, doseq=True)
-        next_page_url = parts._replace(query=new_query).geturl()
+        next_page_url = thread_page_url(thread_url, page_num)
 
         logging.info(f"Crawling thread page {page_num}/{total_pages}: {next_page_url}")
         page_soup = fetch_thread_soup(next_page_url, expected_page_thread_id)
@@ -302,29 +445,309 @@ def crawl_thread(thread_url, thread_id):
             logging.warning(f"Warning: Failed to fetch page {page_num}. Skipping.")
             continue
 
-        for post_element in page_soup.select("div.post-card"):
-            post_content = parse_post(
-                post_element, config.BASE_URL, len(thread_data["posts"]) + 1
-            )
-            if post_content:
-                thread_data["posts"].append(post_content)
+        parse_page_posts(page_soup, page_num, thread_data["posts"], inline_sink, fingerprints)
 
-        time.sleep(1)
+    return thread_data
+
+
+def _fall_back(thread_id, reason):
+    """Gives up on an update from the last page that was already under way, counting it for the summary."""
+    logging.info(f"{reason} Falling back to a full crawl of thread {thread_id}.")
+    with _update_stats_lock:
+        _update_stats["full"] += 1
+    return None
+
+
+def crawl_thread_update(thread_url, thread_id, existing, inline_sink=None, fingerprints=None):
+    """Brings a stored thread up to date by fetching only its last stored page and the pages after it.
+
+    Posts on earlier pages are kept from the stored copy. The floors stored for the last page
+    must be the first floors the site now shows on that page, and no fetched floor may repeat
+    a kept one; otherwise (e.g. deleted posts shifted the pages) this returns None and the
+    caller falls back to a full crawl. Threads stored before posts carried their page number,
+    and threads missing posts from an earlier page (e.g. one that failed during a full crawl),
+    also return None, and are upgraded or filled in by that full crawl.
+    """
+    posts = existing.get("posts") or []
+    if not posts or any(not isinstance(post.get("page"), int) for post in posts):
+        return None
+    start_page = posts[-1]["page"]
+    if start_page <= 1:
+        return None  # Page 1 is all there is to skip, so a full crawl costs the same.
 
+    kept_posts = [post for post in posts if post["page"] < start_page]
+    if {post["page"] for post in kept_posts} != set(range(1, start_page)):
+        logging.info(f"Thread {thread_id} is missing stored pages before page {start_page}.")
+        return None
+    kept_floors = {post.get("floor") for post in kept_posts}
+    stored_floors = [post.get("floor") for post in posts if post["page"] == start_page]
+    expected_page_thread_id = get_url_thread_id(thread_url)
+
+    page_url = thread_page_url(thread_url, start_page)
+    logging.info(f"Updating thread {thread_id} from page {start_page}: {page_url}")
+    soup = fetch_thread_soup(page_url, expected_page_thread_id)
+    if not soup:
+        return _fall_back(thread_id, f"Could not fetch page {start_page}.")
+    total_pages = get_total_pages(soup)
+    if total_pages < start_page:
+        return _fall_back(thread_id, f"It now has {total_pages} pages, fewer than the {start_page} stored.")
+
+    title_element = soup.select_one("header h3")
+    thread_data = {
+        "posts": list(kept_posts),
+        "title": title_element.text.strip() if title_element else existing.get("title", "Untitled"),
+        "id": thread_id,
+        "url": thread_url,
+    }
+    parse_page_posts(soup, start_page, thread_data["posts"], inline_sink, fingerprints)
+    fetched_floors = [post.get("floor") for post in thread_data["posts"][len(kept_posts):]]
+    if fetched_floors[:len(stored_floors)] != stored_floors or kept_floors.intersection(fetched_floors):
+        return _fall_back(thread_id, f"Floors on page {start_page} no longer match the stored ones.")
+
+    for page_num in range(start_page + 1, total_pages + 1):
+        next_page_url = thread_page_url(thread_url, page_num)
+        logging.info(f"Crawling thread page {page_num}/{total_pages}: {next_page_url}")
+        page_soup = fetch_thread_soup(next_page_url, expected_page_thread_id)
+        if not page_soup:
+            return _fall_back(thread_id, f"Could not fetch page {page_num}.")
+        page_start = len(thread_data["posts"])
+        parse_page_posts(page_soup, page_num, thread_data["posts"], inline_sink, fingerprints)
+        if kept_floors.intersection(post.get("floor") for post in thread_data["posts"][page_start:]):
+            return _fall_back(thread_id, f"Floors on page {page_num} repeat stored ones.")
+
+    with _update_stats_lock:
+        _update_stats["incremental"] += 1
+        _update_stats["pages_skipped"] += start_page - 1
     return thread_data
 
 
-def save_thread_to_json(thread_data, board_path):
-    """Saves the crawled thread data to a JSON file."""
+def save_thread(thread_data, board_path):
+    """Saves the crawled thread data to the board's thread store."""
     if not thread_data or not thread_data.get("id"):
-        return None
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
-    os.makedirs(json_dir, exist_ok=True)
-    json_filepath = os.path.join(json_dir, f"{thread_data['id']}.json")
-    logging.info(f"Saving thread to {json_filepath}")
-    with open(json_filepath, "w", encoding="utf-8") as f:
-        json.dump(thread_data, f, ensure_ascii=False, indent=4)
-    return json_filepath
+        return False
+    logging.info(f"Saving thread {thread_data['id']} to {get_thread_store(board_path).location}")
+    get_thread_store(board_path).save(thread_data)
+    return True
+
+
+def crawl_and_save(thread_meta, board_path, run_mode="overwrite"):
+    """Crawls one thread from its CSV row and saves it. Returns True on success.
+
+    In update mode, a thread that is already stored is first updated from its last stored page.
+    """
+    logging.info(f"\n--- Processing thread {thread_meta['id']}: {thread_meta['title']} ---")
+
+    inline_sink = make_inline_sink(board_path, thread_meta["id"])
+    fingerprints = {}
+    thread_data = None
+    if run_mode == "update":
+        try:
+            existing = get_thread_store(board_path).load(thread_meta["id"])
+        except (ValueError, OSError) as e:
+            logging.warning(f"Could not load stored thread {thread_meta['id']}: {e}")
+            existing = None
+        if existing and existing.get("url") == thread_meta["url"]:
+            thread_data = crawl_thread_update(
+                thread_meta["url"], thread_meta["id"], existing, inline_sink, fingerprints
+            )
+
+    keep_before = min(fingerprints) if thread_data and fingerprints else None
+    if thread_data is None:
+        fingerprints = {}
+        thread_data = crawl_thread(thread_meta["url"], thread_meta["id"], inline_sink, fingerprints)
+    if not thread_data or not thread_data["posts"]:
+        logging.error(f"Failed to crawl thread {thread_meta['id']}.")
+        return False
+
+    save_thread(thread_data, board_path)
+    record_page_fingerprints(board_path, thread_meta["id"], fingerprints, keep_before)
+    return True
+
+
+def print_update_stats():
+    print(f"Updated from last page:   {_update_stats['incremental']} "
+          f"({_update_stats['pages_skipped']} pages not re-fetched, {_update_stats['full']} full re-crawls)")
+
+
+def needs_crawl(thread_meta, store):
+    """Decides in update mode whether a CSV row's thread has to be crawled, from the store's summary of it."""
+    try:
+        summary = store.summary(thread_meta["id"])
+        if summary is None:
+            return True
+
+        if summary.get("url") != thread_meta.get("url"):
+            logging.warning(
+                f"Existing JSON URL mismatch for thread {thread_meta['id']}. Re-crawling."
+            )
+            return True
+
+        replies_in_csv = int(thread_meta["replies"])
+        replies_in_json = summary["post_count"] - 1
+
+        last_reply_date_csv = datetime.strptime(
+            thread_meta["last_reply_date"], "%Y-%m-%d"
+        )
+
+        latest_date_in_json = datetime.min
+        if summary["max_post_time"]:
+            latest_date_in_json = datetime.strptime(
+                summary["max_post_time"], "%Y-%m-%d %H:%M:%S"
+            )
+
+        return not (
+            replies_in_csv <= replies_in_json
+            and last_reply_date_csv.date() >= latest_date_in_json.date()
+        )
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+        logging.warning(
+            f"Warning: Could not validate existing JSON for thread {thread_meta['id']}. Re-crawling. Error: {e}"
+        )
+    return True
+
+
+def retry_delay(attempts):
+    """Seconds to wait before crawling a thread again after it failed attempts times in a row."""
+    return min(CRAWL_RETRY_MAX_DELAY, CRAWL_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def plan_crawl(all_threads, mode, store, frontier, csv_name, restart=False):
+    """Picks the CSV rows to crawl and queues them in the board's crawl frontier.
+
+    If the frontier still holds unfinished threads queued from the same CSV in the same mode,
+    e.g. because the last run was killed, those and the threads that failed in that run are
+    picked again without filtering the CSV, unless restart is set. Threads whose last failure
+    is still backing off are held back. Returns (rows to crawl, rows held back, resumed).
+    """
+    queued = {
+        entry["id"]: entry for entry in frontier.values()
+        if entry.get("csv") == csv_name and entry.get("mode") == mode
+    }
+    resumed = not restart and any(entry["state"] in UNFINISHED_STATES for entry in queued.values())
+
+    now = time.time()
+    to_crawl = []
+    held_back = []
+    pending = {}
+    for thread_meta in all_threads:
+        if resumed:
+            if thread_meta["id"] not in queued or queued[thread_meta["id"]]["state"] == "done":
+                continue
+        elif mode == "update" and not needs_crawl(thread_meta, store):
+            continue
+        entry = frontier.get(thread_meta["id"]) or {}
+        if entry.get("retry_at", 0) > now:
+            held_back.append(thread_meta)
+            continue
+        to_crawl.append(thread_meta)
+        pending[thread_meta["id"]] = {
+            "state": "pending", "csv": csv_name, "mode": mode,
+            "attempts": entry.get("attempts", 0), "error": entry.get("error"),
+        }
+    frontier.record_many(pending)
+    return to_crawl, held_back, resumed
+
+
+def crawl_queued(thread_meta, board_path, mode, frontier, csv_name):
+    """Runs crawl_and_save() for a thread queued in the frontier and records the outcome there."""
+    entry = frontier.get(thread_meta["id"]) or {}
+    attempts = entry.get("attempts", 0)
+    frontier.record(thread_meta["id"], state="in_progress", csv=csv_name, mode=mode,
+                    attempts=attempts, error=entry.get("error"))
+    try:
+        succeeded = crawl_and_save(thread_meta, board_path, mode)
+        error = None if succeeded else "no posts could be fetched"
+    except Exception as e:
+        logging.exception(f"Unexpected error crawling thread {thread_meta['id']}: {e}")
+        succeeded, error = False, f"{type(e).__name__}: {e}"
+
+    if succeeded:
+        frontier.record(thread_meta["id"], state="done", csv=csv_name, mode=mode, attempts=0)
+        return True
+    attempts += 1
+    frontier.record(thread_meta["id"], state="failed", csv=csv_name, mode=mode, attempts=attempts,
+                    error=error, retry_at=time.time() + retry_delay(attempts))
+    return False
+
+
+def record_page_fingerprints(board_path, thread_id, fingerprints, keep_before=None):
+    """Stores the fingerprints of freshly fetched pages of a thread, marked as verified now.
+
+    With keep_before, the stored fingerprints of the pages before it, whose posts an
+    update from the last page kept, are kept as well.
+    """
+    index = get_page_fingerprints(board_path)
+    entry = index.get(thread_id)
+    pages = {}
+    if keep_before and entry:
+        pages = {page: value for page, value in entry["pages"].items() if int(page) < keep_before}
+    now = time.time()
+    pages.update({str(page): [fingerprint, now] for page, fingerprint in fingerprints.items()})
+    index.record(thread_id, pages=pages)
+
+
+def revalidate_pages(board_path, threads, budget, workers, verified_before):
+    """Re-fetches the budget stored pages that were verified longest ago and compares their fingerprints.
+
+    threads are the CSV rows to consider. Pages verified at or after verified_before, i.e.
+    fetched earlier in this run, are left alone; the earlier pages of a thread updated from
+    its last page are not. Pages that still match are marked as verified.
+    Returns (pages checked, rows of threads with a changed page).
+    """
+    index = get_page_fingerprints(board_path)
+    threads_by_id = {thread_meta["id"]: thread_meta for thread_meta in threads}
+    candidates = []
+    for thread_id in threads_by_id:
+        entry = index.get(thread_id)
+        if entry:
+            candidates.extend(
+                (verified_at, thread_id, int(page))
+                for page, (_, verified_at) in entry["pages"].items()
+                if verified_at < verified_before
+            )
+    selected = heapq.nsmallest(budget, candidates)
+
+    def fetch_fingerprint(thread_id, page_num):
+        thread_url = threads_by_id[thread_id]["url"]
+        page_url = thread_url if page_num == 1 else thread_page_url(thread_url, page_num)
+        soup = fetch_thread_soup(page_url, get_url_thread_id(thread_url))
+        return page_fingerprint(soup) if soup else None
+
+    verified = {}
+    changed_ids = set()
+    checked = 0
+    with alive_bar(len(selected)) as bar, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_fingerprint, thread_id, page_num): (thread_id, page_num)
+            for _, thread_id, page_num in selected
+        }
+        for future in as_completed(futures):
+            thread_id, page_num = futures[future]
+            try:
+                fingerprint = future.result()
+            except Exception as e:
+                logging.exception(f"Unexpected error revalidating page {page_num} of thread {thread_id}: {e}")
+                fingerprint = None
+            bar()
+            if fingerprint is None:
+                continue  # Not verified, so it stays first in line for the next run.
+            checked += 1
+            if fingerprint == index.get(thread_id)["pages"][str(page_num)][0]:
+                verified.setdefault(thread_id, []).append(page_num)
+            else:
+                logging.info(f"Page {page_num} of thread {thread_id} changed since it was crawled.")
+                changed_ids.add(thread_id)
+
+    now = time.time()
+    for thread_id, page_nums in verified.items():
+        if thread_id in changed_ids:
+            continue  # Re-crawling it records fresh fingerprints for every page.
+        pages = dict(index.get(thread_id)["pages"])
+        for page_num in page_nums:
+            pages[str(page_num)] = [pages[str(page_num)][0], now]
+        index.record(thread_id, pages=pages)
+
+    return checked, [threads_by_id[thread_id] for thread_id in sorted(changed_ids)]
 
 
 def main():
@@ -349,10 +772,37 @@ def main():
         choices=["overwrite", "update"],
         help="Run mode: 'overwrite' or 'update'.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=getattr(config, "THREAD_WORKERS", 1),
+        help="Number of threads crawled in parallel.",
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        type=float,
+        default=getattr(config, "REQUESTS_PER_SECOND", 1.0),
+        help="Global cap on page requests per second shared by all workers. 0 disables the limit.",
+    )
+    parser.add_argument(
+        "--revalidate_pages",
+        type=int,
+        default=getattr(config, "REVALIDATE_PAGES", 0),
+        help="Stored thread pages to re-fetch to catch edits, least recently verified first. 0 disables it.",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Filter the CSV again instead of resuming a run that did not finish.",
+    )
     args = parser.parse_args()
 
-    logging.basicConfig(filename=f'output/{args.board_id}/step_2.log', filemode='w', encoding='utf-8',
-                        level=logging.DEBUG, format='%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s')
+    logging.basicConfig(filename=os.path.join(get_board_path(args.board_id), 'step_2.log'), filemode='w', encoding='utf-8',
+                        level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(threadName)s %(funcName)s(%(lineno)d) %(message)s')
+
+    set_request_rate(args.requests_per_second)
+    workers = max(1, args.workers)
 
     print("--- Running Step 2: Crawl Individual Threads ---")
 
@@ -380,108 +830,97 @@ def main():
     with open(csv_filepath, "r", encoding="utf-8") as f:
         all_threads = list(csv.DictReader(f))
 
-    # --- New Summary, Retry, and Smart Update Logic ---
-
-    threads_to_process = []
-    skipped_count = 0
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
-    os.makedirs(json_dir, exist_ok=True)
-
-    # Smart filtering for update mode
-    for thread_meta in all_threads:
-        json_filepath = os.path.join(json_dir, f"{thread_meta['id']}.json")
-        if os.path.exists(json_filepath) and args.mode == "update":
-            try:
-                with open(json_filepath, "r", encoding="utf-8") as f:
-                    existing_json = json.load(f)
-
-                if existing_json.get("url") != thread_meta.get("url"):
-                    logging.warning(
-                        f"Existing JSON URL mismatch for thread {thread_meta['id']}. Re-crawling."
-                    )
-                    threads_to_process.append(thread_meta)
-                    continue
-
-                replies_in_csv = int(thread_meta["replies"])
-                replies_in_json = len(existing_json.get("posts", [])) - 1
-
-                last_reply_date_csv = datetime.strptime(
-                    thread_meta["last_reply_date"], "%Y-%m-%d"
-                )
-
-                latest_date_in_json = datetime.min
-                for post in existing_json.get("posts", []):
-                    if post.get("post_time") and post["post_time"] != "N/A":
-                        post_time = datetime.strptime(
-                            post["post_time"], "%Y-%m-%d %H:%M:%S"
-                        )
-                        if post_time > latest_date_in_json:
-                            latest_date_in_json = post_time
-
-                if (
-                    replies_in_csv <= replies_in_json
-                    and last_reply_date_csv.date() >= latest_date_in_json.date()
-                ):
-                    skipped_count += 1
-                    continue
-            except (json.JSONDecodeError, KeyError, ValueError, IndexError) as e:
-                logging.warning(
-                    f"Warning: Could not validate existing JSON for thread {thread_meta['id']}. Re-crawling. Error: {e}"
-                )
+    # --- Crawl frontier, Retry, and Smart Update Logic ---
 
-        threads_to_process.append(thread_meta)
+    store = get_thread_store(board_path)
+    frontier = get_crawl_frontier(board_path)
+    csv_name = os.path.basename(csv_filepath)
+    threads_to_process, held_back, resumed = plan_crawl(
+        all_threads, args.mode, store, frontier, csv_name, args.restart
+    )
+    if resumed:
+        print(f"Resuming the unfinished run on {csv_name}: {len(threads_to_process)} threads left.")
 
     total_in_csv = len(all_threads)
     total_to_crawl = len(threads_to_process)
-    max_retries = 3
-
-    for attempt in range(max_retries):
-        if not threads_to_process:
-            break
-
-        print(
-            f"\n--- Running crawl attempt {attempt + 1}/{max_retries} for {len(threads_to_process)} threads ---"
-        )
-
-        currently_failed_threads = []
-
-        with alive_bar(len(all_threads)) as bar:
-            for i, thread_meta in enumerate(threads_to_process):
-                logging.info(
-                    f"\n--- Processing thread {i + 1}/{len(threads_to_process)}: {thread_meta['title']} ---"
-                )
-
-                thread_data = crawl_thread(thread_meta["url"], thread_meta["id"])
-
-                if not thread_data or not thread_data["posts"]:
-                    logging.error(f"Failed to crawl thread {thread_meta['id']}.")
-                    currently_failed_threads.append(thread_meta)
-                else:
-                    save_thread_to_json(thread_data, board_path)
-
+    skipped_count = total_in_csv - total_to_crawl - len(held_back)
+    run_started = time.time()
+
+    final_failed_threads = []
+    while threads_to_process:
+        now = time.time()
+        due = [meta for meta in threads_to_process if frontier.get(meta["id"]).get("retry_at", 0) <= now]
+        if not due:
+            wait = min(frontier.get(meta["id"])["retry_at"] for meta in threads_to_process) - now
+            print(f"\n--- {len(threads_to_process)} threads failed. Retrying in {wait:.0f} seconds... ---")
+            time.sleep(max(0, wait))
+            continue
+        due_ids = {meta["id"] for meta in due}
+        threads_to_process = [meta for meta in threads_to_process if meta["id"] not in due_ids]
+
+        print(f"\n--- Crawling {len(due)} threads with {workers} worker(s) ---")
+
+        with alive_bar(len(due)) as bar, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(crawl_queued, thread_meta, board_path, args.mode, frontier, csv_name): thread_meta
+                for thread_meta in due
+            }
+            for future in as_completed(futures):
+                thread_meta = futures[future]
+                if not future.result():
+                    # Retries due soon are waited for now, the rest are left to a later run.
+                    if retry_delay(frontier.get(thread_meta["id"])["attempts"]) <= CRAWL_RETRY_WAIT:
+                        threads_to_process.append(thread_meta)
+                    else:
+                        final_failed_threads.append(thread_meta)
                 bar()
 
-        threads_to_process = currently_failed_threads
-
-        if threads_to_process:
-            print(
-                f"\n--- {len(threads_to_process)} threads failed. Retrying in 5 seconds... ---"
-            )
-            time.sleep(5)
-
-    final_failed_threads = threads_to_process
-    success_count = total_to_crawl - len(final_failed_threads)
+    revalidated_pages = 0
+    edited_threads = []
+    if args.revalidate_pages > 0:
+        print(f"\n--- Revalidating up to {args.revalidate_pages} stored pages ---")
+        revalidated_pages, edited_threads = revalidate_pages(
+            board_path, all_threads, args.revalidate_pages, workers, run_started
+        )
+        if edited_threads:
+            print(f"--- Re-crawling {len(edited_threads)} threads with changed pages ---")
+            with alive_bar(len(edited_threads)) as bar, ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(crawl_and_save, thread_meta, board_path, "overwrite"): thread_meta
+                    for thread_meta in edited_threads
+                }
+                for future in as_completed(futures):
+                    thread_meta = futures[future]
+                    try:
+                        succeeded = future.result()
+                    except Exception as e:
+                        logging.exception(f"Unexpected error crawling thread {thread_meta['id']}: {e}")
+                        succeeded = False
+                    if not succeeded:
+                        final_failed_threads.append(thread_meta)
+                    bar()
+
+    success_count = total_to_crawl + len(edited_threads) - len(final_failed_threads)
     final_failed_ids = [meta["id"] for meta in final_failed_threads]
 
     print("\n" + "=" * 25)
     print("--- Crawl Summary ---")
     print(f"Total threads in CSV:   {total_in_csv}")
     print(f"Already existed:        {skipped_count}")
-    print(f"Attempted to crawl:     {total_to_crawl}")
+    if held_back:
+        print(f"Held back by back-off:  {len(held_back)}")
+    print(f"Attempted to crawl:     {total_to_crawl + len(edited_threads)}")
     print(f"Successfully crawled:   {success_count}")
     print(f"Failed to crawl:          {len(final_failed_ids)}")
     if final_failed_ids:
         print(f"Failed thread IDs: {', '.join(final_failed_ids)}")
+    if args.revalidate_pages > 0:
+        print(f"Revalidated pages:      {revalidated_pages} ({len(edited_threads)} threads changed and re-crawled)")
+    if args.mode == "update":
+        print_update_stats()
+    print_http_cache_stats()
+    print_rate_stats()
+    print_session_stats()
     print("=" * 25)
     print("\nStep 2 finished.\n")
 
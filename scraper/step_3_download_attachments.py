@@ -5,13 +5,285 @@ import base64
 import json
 import logging
 import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
+from scraper.blob_store import board_id_from_path, get_blob_store
+from scraper.serialization import write_atomic
+from scraper.storage import get_thread_store
 from scraper.utils import fetch, get_board_path, sanitize_filename
 
 
+DOWNLOAD_CHUNK_SIZE = getattr(config, 'DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+DOWNLOAD_JOURNAL_NAME = 'download_journal.jsonl'
+
+
+class ThroughputCounter:
+    """Thread-safe counter of bytes written, used to report download throughput."""
+
+    def __init__(self):
+        self.total_bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, num_bytes):
+        with self._lock:
+            self.total_bytes += num_bytes
+
+    def bytes_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.total_bytes / elapsed if elapsed > 0 else 0.0
+
+
+throughput = ThroughputCounter()
+
+
+def format_bytes(num_bytes):
+    """Formats a byte count for progress output, e.g. '12.3 MB'."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+def write_bytes_atomic(filepath, data):
+    """Writes data to filepath via a temp file and rename, so readers never see a partial file."""
+    write_atomic(filepath, data)
+    throughput.add(len(data))
+
+
+class DownloadJournal:
+    """Append-only record of attachment downloads for one board.
+
+    Each line holds the expected size and ETag of one file, and whether it was
+    completely downloaded. Later lines for the same file win.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path):
+            return
+        num_lines = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash.
+                self.entries[entry['key']] = entry
+                num_lines += 1
+        if num_lines > 2 * len(self.entries):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        with self._lock:
+            return self.entries.get(key)
+
+    def record(self, key, **fields):
+        entry = {'key': key, **fields}
+        with self._lock:
+            self.entries[key] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def is_complete(self, key, filepath):
+        """True if the journal says filepath was fully downloaded and its size still matches."""
+        entry = self.get(key)
+        if not entry or not entry.get('complete') or not os.path.exists(filepath):
+            return False
+        return entry.get('size') is None or os.path.getsize(filepath) == entry['size']
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_download_journal(board_path):
+    """Returns the shared download journal of a board."""
+    attachment_root = os.path.join(board_path, config.ATTACHMENT_DIR_NAME)
+    with _journals_lock:
+        if attachment_root not in _journals:
+            os.makedirs(attachment_root, exist_ok=True)
+            _journals[attachment_root] = DownloadJournal(os.path.join(attachment_root, DOWNLOAD_JOURNAL_NAME))
+        return _journals[attachment_root]
+
+
+# Content-Length counts encoded bytes, so ask for the file as stored to keep sizes and byte ranges comparable.
+IDENTITY_ENCODING = {'Accept-Encoding': 'identity'}
+
+
+def _expected_size(response, offset):
+    """Reads the full file size from Content-Range or Content-Length, if the server sent one."""
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        # Compressed anyway: the lengths describe the encoded stream, not the file written to disk.
+        return None
+    content_range = response.headers.get('Content-Range', '')
+    match = re.search(r'/(\d+)$', content_range)
+    if match:
+        return int(match.group(1))
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def stream_to_file(url, filepath, journal, key, timeout=60):
+    """Streams a download to filepath.part in chunks, resuming a previous partial download if possible.
+
+    The .part file is renamed to filepath only once the expected size is reached,
+    so an interrupted download never looks complete.
+    """
+    part_path = f"{filepath}.part"
+    entry = journal.get(key) or {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    headers = dict(IDENTITY_ENCODING)
+    if offset and entry.get('url') == url:
+        headers['Range'] = f"bytes={offset}-"
+        if entry.get('etag'):
+            # Only resume if the file on the server is still the one we started.
+            headers['If-Range'] = entry['etag']
+    else:
+        offset = 0
+
+    try:
+        response = fetch(url, timeout=timeout, throttle=False, stream=True, headers=headers)
+    except requests.exceptions.HTTPError as e:
+        if 'Range' not in headers or e.response is None or e.response.status_code != 416:
+            raise
+        # The partial file does not fit the server's copy any more; start over.
+        e.response.close()
+        os.remove(part_path)
+        offset = 0
+        response = fetch(url, timeout=timeout, throttle=False, stream=True, headers=IDENTITY_ENCODING)
+
+    if response.status_code != 206:
+        offset = 0
+    expected_size = _expected_size(response, offset)
+    etag = response.headers.get('ETag')
+    journal.record(key, url=url, size=expected_size, etag=etag, complete=False)
+    if offset:
+        logging.info(f"Resuming {url} at byte {offset}")
+
+    with response, open(part_path, 'ab' if offset else 'wb') as f:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            throughput.add(len(chunk))
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        # A dropped connection raises above and keeps the .part to resume from; a whole response
+        # of the wrong size is no usable prefix.
+        os.remove(part_path)
+        raise IOError(f"Incomplete download of {url}: got {size} of {expected_size} bytes")
+    os.replace(part_path, filepath)
+    journal.record(key, url=url, size=size, etag=etag, complete=True)
+
+
+def verify_existing_download(url, filepath, journal, key, timeout=60):
+    """Checks a file downloaded before the journal existed against the server's Content-Length.
+
+    Returns True and journals the file if it looks complete.
+    """
+    try:
+        response = fetch(url, timeout=timeout, throttle=False, method='HEAD', allow_redirects=True,
+                         headers=IDENTITY_ENCODING)
+    except Exception as e:
+        logging.warning(f"Could not verify existing attachment {filepath}: {e}")
+        return False
+
+    size = os.path.getsize(filepath)
+    expected_size = _expected_size(response, 0)
+    if expected_size is not None and expected_size != size:
+        logging.warning(f"Existing attachment {filepath} has {size} of {expected_size} bytes. Re-downloading.")
+        return False
+
+    journal.record(key, url=url, size=size, etag=response.headers.get('ETag'), complete=True)
+    return True
+
+
+def _mark_inline_saved(attachment):
+    """Drops the base64 payload of an inline image that is now saved as a file."""
+    if attachment.get('type') == 'base64' and attachment.pop('data', None):
+        attachment['type'] = 'inline_file'
+        attachment['saved'] = True
+        return True
+    return False
+
+
+class InlineImageSink:
+    """Saves the decoded inline images of one thread where step 3 would put them, as step 2 parses them."""
+
+    def __init__(self, board_path, thread_id):
+        self.board_path = board_path
+        self.thread_id = str(thread_id)
+        self.store = get_blob_store()
+
+    def save(self, filename, data):
+        filename = sanitize_filename(filename)
+        if self.store:
+            blob_hash = self.store.put_bytes(data, filename)
+            self.store.add_ref(board_id_from_path(self.board_path), self.thread_id, filename, blob_hash)
+            return
+        attachment_dir = os.path.join(self.board_path, config.ATTACHMENT_DIR_NAME, self.thread_id)
+        os.makedirs(attachment_dir, exist_ok=True)
+        write_atomic(os.path.join(attachment_dir, filename), data)
+
+
+def make_inline_sink(board_path, thread_id):
+    """Returns the sink step 2 writes inline images to, or None if config.INLINE_IMAGES_TO_DISK is off."""
+    if not getattr(config, 'INLINE_IMAGES_TO_DISK', True):
+        return None
+    return InlineImageSink(board_path, thread_id)
+
+
+def store_attachment(attachment, store, board_id, thread_id, filename, journal, journal_key, run_mode):
+    """Saves one attachment into the shared blob store. Returns True if the attachment dict changed."""
+    if run_mode == 'update' and store.resolve(board_id, thread_id, filename):
+        logging.info(f"Attachment {filename} already stored. Skipping download in update mode.")
+        return _mark_inline_saved(attachment)
+
+    try:
+        if attachment['type'] == 'url':
+            blob_hash = store.lookup_url(attachment['url'])
+            if blob_hash:
+                logging.info(f"Attachment {attachment['url']} already stored as {blob_hash}. Skipping download.")
+            else:
+                logging.info(f"Downloading attachment {attachment['url']} into the blob store")
+                tmp_path = store.tmp_path(f"{board_id}/{journal_key}")
+                stream_to_file(attachment['url'], tmp_path, journal, journal_key, timeout=60)
+                blob_hash = store.put_file(tmp_path, filename)
+            store.add_ref(board_id, thread_id, filename, blob_hash, url=attachment['url'])
+        elif attachment['type'] == 'base64':
+            logging.info(f"Saving base64 attachment {filename} into the blob store")
+            header, encoded = attachment['data'].split(',', 1)
+            data = base64.b64decode(encoded)
+            blob_hash = store.put_bytes(data, filename)
+            throughput.add(len(data))
+            store.add_ref(board_id, thread_id, filename, blob_hash)
+            return _mark_inline_saved(attachment)
+    except Exception as e:
+        logging.error(f"Failed to store attachment {attachment.get('url', filename)}: {e}")
+    return False
+
+
 def download_attachments(thread_data, board_path, run_mode):
     """Downloads attachments for a given thread."""
     if not thread_data or not thread_data.get('id'):
@@ -23,38 +295,48 @@ def download_attachments(thread_data, board_path, run_mode):
     if not all_attachments:
         return False  # No attachments in this thread, so do nothing.
 
-    # Create directory only if there are attachments
+    store = get_blob_store()
+    board_id = board_id_from_path(board_path)
     attachment_dir = os.path.join(board_path, config.ATTACHMENT_DIR_NAME, thread_data['id'])
-    os.makedirs(attachment_dir, exist_ok=True)
+    if not store:
+        # Create directory only if there are attachments
+        os.makedirs(attachment_dir, exist_ok=True)
+    journal = get_download_journal(board_path)
     modified = False
 
     for attachment in all_attachments:
         filename = sanitize_filename(attachment['filename'])
         filepath = os.path.join(attachment_dir, filename)
+        journal_key = f"{thread_data['id']}/{filename}"
+
+        if store:
+            if store_attachment(attachment, store, board_id, thread_data['id'], filename,
+                                journal, journal_key, run_mode):
+                modified = True
+            continue
 
-        if run_mode == 'update' and os.path.exists(filepath):
+        if run_mode == 'update' and attachment['type'] == 'url' and os.path.exists(filepath):
+            if journal.is_complete(journal_key, filepath) or (
+                journal.get(journal_key) is None
+                and verify_existing_download(attachment['url'], filepath, journal, journal_key)
+            ):
+                logging.info(f"Attachment {filename} already downloaded. Skipping download in update mode.")
+                continue
+        elif run_mode == 'update' and os.path.exists(filepath):
             logging.info(f"Attachment {filename} already exists. Skipping download in update mode.")
-            if attachment.get('type') == 'base64' and attachment.pop('data', None):
-                attachment['type'] = 'inline_file'
-                attachment['saved'] = True
+            if _mark_inline_saved(attachment):
                 modified = True
             continue
 
         try:
             if attachment['type'] == 'url':
                 logging.info(f"Downloading attachment {attachment['url']} to {filepath}")
-                response = fetch(attachment['url'], timeout=60)
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+                stream_to_file(attachment['url'], filepath, journal, journal_key, timeout=60)
             elif attachment['type'] == 'base64':
                 logging.info(f"Saving base64 attachment to {filepath}")
                 header, encoded = attachment['data'].split(',', 1)
-                data = base64.b64decode(encoded)
-                with open(filepath, 'wb') as f:
-                    f.write(data)
-                attachment.pop('data', None)
-                attachment['type'] = 'inline_file'
-                attachment['saved'] = True
+                write_bytes_atomic(filepath, base64.b64decode(encoded))
+                _mark_inline_saved(attachment)
                 modified = True
         except Exception as e:
             logging.error(f"Failed to download attachment {attachment.get('url', 'N/A')}: {e}")
@@ -62,42 +344,56 @@ def download_attachments(thread_data, board_path, run_mode):
     return modified
 
 
+def process_thread(thread_id, board_path, run_mode):
+    """Downloads the attachments of one stored thread and saves it again if inline images were extracted."""
+    logging.info(f"\n--- Processing thread {thread_id} ---")
+    store = get_thread_store(board_path)
+    thread_data = store.load(thread_id)
+
+    modified = download_attachments(thread_data, board_path, run_mode)
+    if modified:
+        store.save(thread_data)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Step 3: Download attachments from JSON files.")
     parser.add_argument("--board_id", type=int, default=config.BOARD_ID, help="The board ID.")
     parser.add_argument("--mode", type=str, default=config.RUN_MODE, choices=['overwrite', 'update'],
                         help="Run mode: 'overwrite' or 'update'.")
+    parser.add_argument("--workers", type=int, default=getattr(config, 'DOWNLOAD_WORKERS', 4),
+                        help="Number of threads whose attachments are downloaded in parallel.")
     args = parser.parse_args()
 
-    logging.basicConfig(filename=f'output/{args.board_id}/step_3.log', filemode='w', encoding='utf-8',
-                        level=logging.DEBUG, format='%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s')
+    logging.basicConfig(filename=os.path.join(get_board_path(args.board_id), 'step_3.log'), filemode='w', encoding='utf-8',
+                        level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(threadName)s %(funcName)s(%(lineno)d) %(message)s')
 
     print("--- Running Step 3: Download Attachments ---")
 
     board_path = get_board_path(args.board_id)
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
+    store = get_thread_store(board_path)
+    thread_ids = store.iter_ids()
 
-    if not os.path.isdir(json_dir):
-        print(f"JSON directory not found at {json_dir}. Please run Step 2 first.")
+    if not thread_ids:
+        print(f"No threads found in {store.location}. Please run Step 2 first.")
         return 1
 
-    json_files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-
-    with alive_bar(len(json_files)) as bar:
-        for i, json_filename in enumerate(json_files):
-            logging.info(f"\n--- Processing file {i + 1}/{len(json_files)}: {json_filename} ---")
-            json_filepath = os.path.join(json_dir, json_filename)
-
-            with open(json_filepath, 'r', encoding='utf-8') as f:
-                thread_data = json.load(f)
-
-            modified = download_attachments(thread_data, board_path, args.mode)
-            if modified:
-                with open(json_filepath, 'w', encoding='utf-8') as f:
-                    json.dump(thread_data, f, ensure_ascii=False, indent=4)
-
+    with alive_bar(len(thread_ids)) as bar, ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(process_thread, thread_id, board_path, args.mode): thread_id
+            for thread_id in thread_ids
+        }
+        for future in as_completed(futures):
+            thread_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logging.exception(f"Failed to process thread {thread_id}: {e}")
+            bar.text(f"{format_bytes(throughput.bytes_per_second())}/s")
             bar()
 
+    print(f"Downloaded {format_bytes(throughput.total_bytes)} "
+          f"at {format_bytes(throughput.bytes_per_second())}/s.")
     print("\nStep 3 finished!\n")
 
 
@@ -2,60 +2,189 @@
 import argparse
 from alive_progress import alive_bar
 import csv
+import hashlib
 import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
 import re
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from urllib.parse import urljoin, unquote
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
+from scraper.blob_store import board_id_from_path, get_blob_store
+from scraper.serialization import dump_file, load_file
+from scraper.storage import get_thread_store
 from scraper.utils import get_board_path, sanitize_filename
 
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+_JUMP_TO_PATTERN = re.compile(r'href="jump-to\.php\?url=([^"]+)"')
+
+
 def _decode_link(match):
     """Decodes a 'jump-to.php' URL from a regex match."""
     url = match.group(1)
     return unquote(url)
 
 
-def render_thread_to_html(thread_data, board_path, board_name):
+def _rewrite_jump_to_link(match):
+    return f'href="{_decode_link(match)}"'
+
+
+def transform_post_content(content):
+    """Turns newlines into <br> and unwraps jump-to.php links to their target URL."""
+    # Replace escaped newlines with HTML line breaks
+    content = content.replace('\n', '<br>\n')
+    # Most posts have no jump-to.php links, and a substring check is much cheaper than a regex scan.
+    if 'jump-to.php' in content:
+        content = _JUMP_TO_PATTERN.sub(_rewrite_jump_to_link, content)
+    return content
+
+
+def list_attachment_files(board_path, thread_id):
+    """Returns the names of a thread's downloaded attachment files with one directory scan."""
+    attachment_dir = os.path.join(board_path, config.ATTACHMENT_DIR_NAME, str(thread_id))
+    try:
+        with os.scandir(attachment_dir) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+RENDER_MANIFEST_NAME = '.render_manifest.json'
+
+
+class Renderer:
+    """Owns one Jinja environment and the compiled templates, reused for every page of a run.
+
+    Compiled template bytecode is cached on disk, so later runs and worker
+    processes skip parsing and compiling the templates as well.
+    """
+
+    def __init__(self, templates_dir=None, cache_dir=None):
+        templates_dir = templates_dir or getattr(config, 'TEMPLATES_DIR', 'templates')
+        if cache_dir is None:
+            cache_dir = os.path.join(config.OUTPUT_DIR, getattr(config, 'JINJA_CACHE_DIR_NAME', '.jinja_cache'))
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=False,
+        )
+        self.thread_template = self.env.get_template('thread.html')
+        self.year_template = self.env.get_template('index_year.html')
+        self.main_template = self.env.get_template('index_main.html')
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """Returns the renderer shared by everything rendered in this process."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = Renderer()
+        return _renderer
+
+
+def write_if_changed(filepath, text):
+    """Writes text to filepath unless the file already has exactly these bytes. Returns True if written."""
+    data = text.encode('utf-8')
+    try:
+        with open(filepath, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def template_fingerprint(board_name):
+    """Hashes everything besides the thread JSON that goes into a thread page."""
+    templates_dir = getattr(config, 'TEMPLATES_DIR', 'templates')
+    hasher = hashlib.sha1(board_name.encode('utf-8'))
+    with open(os.path.join(templates_dir, 'thread.html'), 'rb') as f:
+        hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def attachment_fingerprint(board_path, thread_id):
+    """Hashes which attachment files of a thread exist locally, since that changes the rendered page."""
+    names = list(list_attachment_files(board_path, thread_id))
+    store = get_blob_store()
+    if store:
+        names.extend(f"blob:{name}" for name in store.resolve_thread(board_id_from_path(board_path), thread_id))
+    return hashlib.sha1('\n'.join(sorted(names)).encode('utf-8')).hexdigest()
+
+
+def load_render_manifest(board_path):
+    """Loads the per-thread input fingerprints recorded by the last render."""
+    manifest_path = os.path.join(board_path, config.HTML_DIR_NAME, RENDER_MANIFEST_NAME)
+    try:
+        return load_file(manifest_path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_render_manifest(board_path, manifest):
+    html_dir = os.path.join(board_path, config.HTML_DIR_NAME)
+    os.makedirs(html_dir, exist_ok=True)
+    dump_file(os.path.join(html_dir, RENDER_MANIFEST_NAME), manifest, compact=True)
+
+
+def render_thread_to_html(thread_data, board_path, board_name, renderer=None):
     """Renders a single thread into an HTML file."""
     if not thread_data or not thread_data.get('id'):
         return None
 
-    templates_dir = getattr(config, 'TEMPLATES_DIR', 'templates')
-    env = Environment(loader=FileSystemLoader(templates_dir))
-    template = env.get_template('thread.html')
+    renderer = renderer or get_renderer()
+
+    html_dir = os.path.join(board_path, config.HTML_DIR_NAME)
+    posts_dir = os.path.join(html_dir, 'posts')
+
+    # Attachments kept in the shared blob store are resolved through its index
+    store = get_blob_store()
+    stored_paths = store.resolve_thread(board_id_from_path(board_path), thread_data['id']) if store else {}
+
+    local_files = None
 
     # Process attachments to add local path and image flag
     for post in thread_data.get('posts', []):
         if post.get('content'):
-            # Replace escaped newlines with HTML line breaks
-            post['content'] = post['content'].replace('\n', '<br>\n')
-
-            # Find and replace jump-to.php links
-            jump_to_pattern = r'href="jump-to\.php\?url=([^"]+)"'
-            post['content'] = re.sub(jump_to_pattern, lambda m: f'href="{_decode_link(m)}"', post['content'])
+            post['content'] = transform_post_content(post['content'])
 
         if post.get('attachments'):
+            if local_files is None:
+                local_files = list_attachment_files(board_path, thread_data['id'])
             for att in post['attachments']:
-                att['is_image'] = att['filename'].lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))
+                att['is_image'] = att['filename'].lower().endswith(IMAGE_EXTENSIONS)
+
+                blob_path = stored_paths.get(sanitize_filename(att['filename']))
+                if blob_path:
+                    att['exists'] = True
+                    att['local_path'] = os.path.relpath(blob_path, posts_dir).replace(os.sep, '/')
+                    continue
 
                 # Check if the attachment file actually exists locally
-                local_filepath = os.path.join(
-                    board_path, config.ATTACHMENT_DIR_NAME, thread_data["id"], att["filename"])
-                att['exists'] = os.path.exists(local_filepath)
+                att['exists'] = att['filename'] in local_files
 
                 # Relative path from html/posts/xxx.html to attachments/thread_id/file
                 att['local_path'] = f'../../{config.ATTACHMENT_DIR_NAME}/{thread_data["id"]}/{att["filename"]}'
 
-    html_dir = os.path.join(board_path, config.HTML_DIR_NAME)
-    posts_dir = os.path.join(html_dir, 'posts')
     os.makedirs(posts_dir, exist_ok=True)
 
     if thread_data.get('posts') and thread_data['posts'][0].get('post_time') != 'N/A':
@@ -67,20 +196,86 @@ def render_thread_to_html(thread_data, board_path, board_name):
     html_filepath = os.path.join(posts_dir, html_filename)
 
     logging.info(f"Rendering thread HTML to {html_filepath}")
-    rendered_html = template.render(thread=thread_data, config=config, board_name=board_name)
-    with open(html_filepath, 'w', encoding='utf-8') as f:
-        f.write(rendered_html)
+    rendered_html = renderer.thread_template.render(thread=thread_data, config=config, board_name=board_name)
+    if not write_if_changed(html_filepath, rendered_html):
+        logging.info(f"{html_filepath} is unchanged.")
     return html_filename
 
 
-def render_indices(all_threads_metadata, board_path, board_name, board_url):
+def init_render_worker(log_queue, log_level):
+    """Sends a render worker's log records to the parent process, which writes them to its own log."""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(log_level)
+
+
+class RenderPool(ProcessPoolExecutor):
+    """A pool of render processes whose log lines end up in the parent's log handlers.
+
+    Workers started with spawn have no logging set up, and ones opening the parent's log file again
+    would write over its lines, so their records come back over a queue instead.
+    """
+
+    def __init__(self, max_workers):
+        root = logging.getLogger()
+        self._log_queue = multiprocessing.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, *root.handlers,
+                                                            respect_handler_level=True)
+        self._log_listener.start()
+        super().__init__(max_workers=max_workers, initializer=init_render_worker,
+                         initargs=(self._log_queue, root.level))
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        if wait and self._log_listener is not None:
+            # The workers have exited, so every record they sent is already in the queue.
+            self._log_listener.stop()
+            self._log_listener = None
+
+
+def render_thread_job(job):
+    """Renders one thread unless its inputs are unchanged since the last render.
+
+    Runs in a worker process when step 4 uses --jobs. Returns (html_filename,
+    manifest_entry); manifest_entry is None when the thread was skipped.
+    """
+    thread_id, board_path, board_name, template_hash, previous, mode = job
+    logging.info(f"\n--- Rendering thread {thread_id} ---")
+    store = get_thread_store(board_path)
+    json_hash = store.fingerprint(thread_id)
+
+    if json_hash is None:
+        logging.warning(f"Warning: thread {thread_id} not found in {store.location}. Skipping.")
+        return None, None
+
+    fingerprint = {
+        'json_hash': json_hash,
+        'template_hash': template_hash,
+        'attachments': attachment_fingerprint(board_path, thread_id),
+    }
+
+    if (
+        mode == 'update'
+        and previous
+        and all(previous.get(key) == value for key, value in fingerprint.items())
+        and os.path.exists(os.path.join(board_path, config.HTML_DIR_NAME, 'posts', previous['html_filename']))
+    ):
+        return previous['html_filename'], None
+
+    thread_data = store.load(thread_id)
+    html_filename = render_thread_to_html(thread_data, board_path, board_name)
+    return html_filename, ({**fingerprint, 'html_filename': html_filename} if html_filename else None)
+
+
+def render_indices(all_threads_metadata, board_path, board_name, board_url, renderer=None):
     """Renders the main index and per-year index HTML files for a board."""
     if not all_threads_metadata:
         print("No thread metadata to render indices.")
         return
 
-    templates_dir = getattr(config, 'TEMPLATES_DIR', 'templates')
-    env = Environment(loader=FileSystemLoader(templates_dir))
+    renderer = renderer or get_renderer()
     html_dir = os.path.join(board_path, config.HTML_DIR_NAME)
     years_dir = os.path.join(html_dir, 'years')
     os.makedirs(years_dir, exist_ok=True)
@@ -99,7 +294,7 @@ def render_indices(all_threads_metadata, board_path, board_name, board_url):
     sorted_years = sorted(threads_by_year.keys(), reverse=True)
 
     # Render per-year index files
-    year_template = env.get_template('index_year.html')
+    year_template = renderer.year_template
     for year in sorted_years:
         year_index_filepath = os.path.join(years_dir, f'index_{year}.html')
         print(f"Rendering year index HTML to {year_index_filepath}")
@@ -112,11 +307,10 @@ def render_indices(all_threads_metadata, board_path, board_name, board_url):
             board_name=board_name,
             year=year
         )
-        with open(year_index_filepath, 'w', encoding='utf-8') as f:
-            f.write(rendered_html)
+        write_if_changed(year_index_filepath, rendered_html)
 
     # Render the main index file linking to the year files
-    main_template = env.get_template('index_main.html')
+    main_template = renderer.main_template
     main_index_filepath = os.path.join(html_dir, 'index.html')
     update_date = datetime.now().strftime('%Y-%m-%d')
     print(f"Rendering main index HTML to {main_index_filepath}")
@@ -126,25 +320,29 @@ def render_indices(all_threads_metadata, board_path, board_name, board_url):
         board_url=board_url,
         update_date=update_date
     )
-    with open(main_index_filepath, 'w', encoding='utf-8') as f:
-        f.write(rendered_main_html)
+    write_if_changed(main_index_filepath, rendered_main_html)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Step 4: Render HTML files from JSON.")
     parser.add_argument("--board_id", type=int, default=config.BOARD_ID, help="The board ID.")
+    parser.add_argument("--mode", type=str, default="overwrite", choices=['overwrite', 'update'],
+                        help="Run mode: 'overwrite' re-renders every thread, "
+                             "'update' only threads whose JSON, template or attachments changed.")
+    parser.add_argument("--jobs", type=int, default=getattr(config, 'RENDER_JOBS', 1),
+                        help="Number of worker processes rendering threads in parallel.")
     args = parser.parse_args()
 
-    logging.basicConfig(filename=f'output/{args.board_id}/step_4.log', filemode='w', encoding='utf-8',
+    logging.basicConfig(filename=os.path.join(get_board_path(args.board_id), 'step_4.log'), filemode='w', encoding='utf-8',
                         level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
     print("--- Running Step 4: Render HTML ---")
 
     board_path = get_board_path(args.board_id)
-    json_dir = os.path.join(board_path, config.JSON_DIR_NAME)
+    store = get_thread_store(board_path)
 
-    if not os.path.isdir(json_dir):
-        print(f"JSON directory not found at {json_dir}. Please run Step 2 first.")
+    if not store.iter_ids():
+        print(f"No threads found in {store.location}. Please run Step 2 first.")
         return 1
 
     # We need the CSV to generate the index.html with all metadata
@@ -172,23 +370,39 @@ def main():
 
     print(f"Found {len(full_thread_list)} threads in the CSV index.")
 
-    with alive_bar(len(full_thread_list)) as bar:
-        for i, thread_meta in enumerate(full_thread_list):
-            logging.info(f"\n--- Rendering thread {i + 1}/{len(full_thread_list)}: {thread_meta['title']} ---")
-            json_filepath = os.path.join(json_dir, f"{thread_meta['id']}.json")
-
-            if not os.path.exists(json_filepath):
-                logging.warrning(f"Warning: JSON file not found for thread {thread_meta['id']}. Skipping.")
-                continue
+    manifest = load_render_manifest(board_path)
+    template_hash = template_fingerprint(board_name)
+    skipped_count = 0
+    jobs = [
+        (thread_meta['id'], board_path, board_name, template_hash, manifest.get(thread_meta['id']), args.mode)
+        for thread_meta in full_thread_list
+    ]
 
-            with open(json_filepath, 'r', encoding='utf-8') as f:
-                thread_data = json.load(f)
-
-            html_filename = render_thread_to_html(thread_data, board_path, board_name)
+    with alive_bar(len(full_thread_list)) as bar:
+        if args.jobs > 1:
+            executor = RenderPool(max_workers=args.jobs)
+            # Hand rows to the workers in shards to keep the inter-process overhead low.
+            results = executor.map(render_thread_job, jobs, chunksize=max(1, min(64, len(jobs) // (args.jobs * 4))))
+        else:
+            executor = None
+            results = map(render_thread_job, jobs)
 
-            # Add the generated html_filename to the dict so the index can use it
-            thread_meta['html_filename'] = html_filename
-            bar()
+        try:
+            for thread_meta, (html_filename, manifest_entry) in zip(full_thread_list, results):
+                # Add the generated html_filename to the dict so the index can use it
+                thread_meta['html_filename'] = html_filename
+                if manifest_entry is None and html_filename:
+                    skipped_count += 1
+                elif manifest_entry:
+                    manifest[thread_meta['id']] = manifest_entry
+                bar()
+        finally:
+            if executor:
+                executor.shutdown()
+
+    save_render_manifest(board_path, manifest)
+    if args.mode == 'update':
+        print(f"Skipped {skipped_count} unchanged threads.")
 
     board_url = urljoin(config.BASE_URL, f"thread.php?bid={args.board_id}")
     render_indices(full_thread_list, board_path, board_name, board_url)
@@ -0,0 +1,450 @@
+# scraper/storage.py
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+from scraper.serialization import dump_file, dumps, load_file, loads
+from scraper.utils import get_board_path
+
+
+THREAD_STORES = ("json", "sqlite")
+
+# Fields with their own column; anything else a thread or post carries is kept in an "extra" JSON column.
+_THREAD_FIELDS = ("posts", "title", "id", "url")
+_POST_FIELDS = ("post_time", "edit_time", "author", "floor", "quotes", "content", "attachments")
+
+
+THREAD_INDEX_NAME = "thread_index.jsonl"
+PAGE_FINGERPRINTS_NAME = "page_fingerprints.jsonl"
+CRAWL_FRONTIER_NAME = "crawl_frontier.jsonl"
+POST_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def thread_summary(thread_data):
+    """Returns what step 2 needs to decide whether a thread changed, without keeping its posts around."""
+    max_post_time = None
+    for post in thread_data.get("posts", []):
+        try:
+            post_time = datetime.strptime(post.get("post_time", ""), POST_TIME_FORMAT)
+        except (TypeError, ValueError):
+            continue  # "N/A" or missing.
+        if max_post_time is None or post_time > max_post_time:
+            max_post_time = post_time
+    return {
+        "url": thread_data.get("url"),
+        "post_count": len(thread_data.get("posts", [])),
+        "max_post_time": max_post_time.strftime(POST_TIME_FORMAT) if max_post_time else None,
+    }
+
+
+class ThreadIndex:
+    """Append-only sidecar index of a board, with one entry per thread.
+
+    Each line holds one thread's entry as of its last record(), e.g. the
+    summary, content hash, size and mtime of its JSON file. Later lines for
+    the same thread win.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path):
+            return
+        num_lines = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash.
+                self.entries[entry["id"]] = entry
+                num_lines += 1
+        if num_lines > 2 * len(self.entries):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, thread_id):
+        with self._lock:
+            return self.entries.get(str(thread_id))
+
+    def values(self):
+        with self._lock:
+            return list(self.entries.values())
+
+    def record(self, thread_id, **fields):
+        entry = {"id": str(thread_id), **fields}
+        with self._lock:
+            self.entries[entry["id"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def record_many(self, fields_by_id):
+        """Records several entries with one write, e.g. thread id -> fields."""
+        entries = [{"id": str(thread_id), **fields} for thread_id, fields in fields_by_id.items()]
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    self.entries[entry["id"]] = entry
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _column(value):
+    """JSON text for an SQLite column."""
+    return dumps(value, compact=True).decode("utf-8")
+
+
+def thread_content_hash(thread_data):
+    """Hashes thread content independently of key order and on-disk formatting."""
+    return hashlib.sha1(dumps(thread_data, compact=True, sort_keys=True)).hexdigest()
+
+
+class JsonThreadStore:
+    """The original layout: one jsons/<thread id>.json file per thread."""
+
+    name = "json"
+
+    def __init__(self, board_path):
+        self.board_path = board_path
+        self.location = os.path.join(board_path, config.JSON_DIR_NAME)
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def path(self, thread_id):
+        return os.path.join(self.location, f"{thread_id}.json")
+
+    @property
+    def index(self):
+        # Loaded on first use, as rendering workers never need it.
+        with self._index_lock:
+            if self._index is None:
+                self._index = ThreadIndex(os.path.join(self.board_path, THREAD_INDEX_NAME))
+            return self._index
+
+    def exists(self, thread_id):
+        return os.path.exists(self.path(thread_id))
+
+    def iter_ids(self):
+        """Returns the ids of all stored threads."""
+        try:
+            with os.scandir(self.location) as entries:
+                return sorted(entry.name[:-len(".json")] for entry in entries if entry.name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def load(self, thread_id):
+        """Returns the stored thread dict, or None if the thread is not stored."""
+        try:
+            return load_file(self.path(thread_id))
+        except FileNotFoundError:
+            return None
+
+    def save(self, thread_data):
+        os.makedirs(self.location, exist_ok=True)
+        path = self.path(thread_data["id"])
+        data = dump_file(path, thread_data)
+        self._record_summary(thread_data, path, data)
+
+    def _record_summary(self, thread_data, path, data):
+        stat = os.stat(path)
+        return self.index.record(
+            thread_data["id"],
+            **thread_summary(thread_data),
+            content_hash=hashlib.sha1(data).hexdigest(),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
+
+    def summary(self, thread_id):
+        """Returns the thread's url, post_count, max_post_time and content_hash, or None if it is not stored.
+
+        Comes from the sidecar index; the JSON is only parsed if it changed on disk since it was indexed.
+        """
+        path = self.path(thread_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        entry = self.index.get(thread_id)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry
+
+        with open(path, "rb") as f:
+            data = f.read()
+        return self._record_summary(loads(data), path, data)
+
+    def fingerprint(self, thread_id):
+        """Returns a hash that changes whenever the stored thread changes, or None if it is not stored."""
+        try:
+            with open(self.path(thread_id), "rb") as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+
+class SqliteThreadStore:
+    """All threads of a board in one SQLite database, with posts and attachments in their own tables."""
+
+    name = "sqlite"
+
+    def __init__(self, board_path):
+        self.board_path = board_path
+        self.location = os.path.join(board_path, getattr(config, "THREAD_DB_NAME", "threads.sqlite"))
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS threads (
+                id TEXT PRIMARY KEY,
+                title TEXT,
+                url TEXT,
+                extra TEXT,
+                content_hash TEXT NOT NULL,
+                post_count INTEGER,
+                max_post_time TEXT
+            );
+            CREATE TABLE IF NOT EXISTS posts (
+                thread_id TEXT NOT NULL,
+                post_index INTEGER NOT NULL,
+                floor TEXT,
+                author TEXT,
+                post_time TEXT,
+                edit_time TEXT,
+                content TEXT,
+                quotes TEXT,
+                extra TEXT,
+                PRIMARY KEY (thread_id, post_index)
+            );
+            CREATE INDEX IF NOT EXISTS posts_post_time ON posts (post_time);
+            CREATE TABLE IF NOT EXISTS attachments (
+                thread_id TEXT NOT NULL,
+                post_index INTEGER NOT NULL,
+                attachment_index INTEGER NOT NULL,
+                type TEXT,
+                filename TEXT,
+                url TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (thread_id, post_index, attachment_index)
+            );
+            """
+        )
+        # Databases created before the summary columns existed get them added; summary() fills them lazily.
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(threads)")}
+        for column, column_type in (("post_count", "INTEGER"), ("max_post_time", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE threads ADD COLUMN {column} {column_type}")
+        conn.commit()
+
+    def _conn(self):
+        # SQLite connections can't be shared between threads, so each worker gets its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.location, timeout=60)
+            self._local.conn = conn
+        return conn
+
+    def exists(self, thread_id):
+        return self._conn().execute("SELECT 1 FROM threads WHERE id = ?", (str(thread_id),)).fetchone() is not None
+
+    def iter_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT id FROM threads ORDER BY id")]
+
+    def load(self, thread_id):
+        conn = self._conn()
+        thread_id = str(thread_id)
+        row = conn.execute("SELECT title, url, extra FROM threads WHERE id = ?", (thread_id,)).fetchone()
+        if row is None:
+            return None
+        title, url, extra = row
+
+        attachments = {}
+        for post_index, data in conn.execute(
+            "SELECT post_index, data FROM attachments WHERE thread_id = ? ORDER BY post_index, attachment_index",
+            (thread_id,),
+        ):
+            attachments.setdefault(post_index, []).append(loads(data))
+
+        posts = []
+        for post_index, floor, author, post_time, edit_time, content, quotes, post_extra in conn.execute(
+            "SELECT post_index, floor, author, post_time, edit_time, content, quotes, extra "
+            "FROM posts WHERE thread_id = ? ORDER BY post_index",
+            (thread_id,),
+        ):
+            post = {
+                "post_time": post_time,
+                "edit_time": edit_time,
+                "author": author,
+                "floor": floor,
+                "quotes": loads(quotes) if quotes is not None else None,
+                "content": content,
+            }
+            post = {key: value for key, value in post.items() if value is not None}
+            post["attachments"] = attachments.get(post_index, [])
+            post.update(loads(post_extra) if post_extra else {})
+            posts.append(post)
+
+        thread_data = {"posts": posts, "title": title, "id": thread_id, "url": url}
+        thread_data.update(loads(extra) if extra else {})
+        return thread_data
+
+    def save(self, thread_data):
+        thread_id = str(thread_data["id"])
+        thread_extra = {key: value for key, value in thread_data.items() if key not in _THREAD_FIELDS}
+        post_rows = []
+        attachment_rows = []
+        for post_index, post in enumerate(thread_data.get("posts", [])):
+            post_extra = {key: value for key, value in post.items() if key not in _POST_FIELDS}
+            post_rows.append((
+                thread_id, post_index, post.get("floor"), post.get("author"), post.get("post_time"),
+                post.get("edit_time"), post.get("content"),
+                _column(post["quotes"]) if "quotes" in post else None,
+                _column(post_extra) if post_extra else None,
+            ))
+            for attachment_index, attachment in enumerate(post.get("attachments") or []):
+                attachment_rows.append((
+                    thread_id, post_index, attachment_index, attachment.get("type"), attachment.get("filename"),
+                    attachment.get("url"), _column(attachment),
+                ))
+
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM posts WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM attachments WHERE thread_id = ?", (thread_id,))
+            summary = thread_summary(thread_data)
+            conn.execute(
+                "INSERT OR REPLACE INTO threads (id, title, url, extra, content_hash, post_count, max_post_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, thread_data.get("title"), thread_data.get("url"),
+                    _column(thread_extra) if thread_extra else None,
+                    thread_content_hash(thread_data), summary["post_count"], summary["max_post_time"],
+                ),
+            )
+            conn.executemany("INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", post_rows)
+            conn.executemany("INSERT INTO attachments VALUES (?, ?, ?, ?, ?, ?, ?)", attachment_rows)
+
+    def fingerprint(self, thread_id):
+        row = self._conn().execute("SELECT content_hash FROM threads WHERE id = ?", (str(thread_id),)).fetchone()
+        return row[0] if row else None
+
+    def summary(self, thread_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT url, post_count, max_post_time, content_hash FROM threads WHERE id = ?", (str(thread_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        url, post_count, max_post_time, content_hash = row
+        if post_count is None:
+            summary = thread_summary(self.load(thread_id))
+            post_count, max_post_time = summary["post_count"], summary["max_post_time"]
+            with conn:
+                conn.execute(
+                    "UPDATE threads SET post_count = ?, max_post_time = ? WHERE id = ?",
+                    (post_count, max_post_time, str(thread_id)),
+                )
+        return {"url": url, "post_count": post_count, "max_post_time": max_post_time, "content_hash": content_hash}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_thread_store(board_path, backend=None):
+    """Opens a thread store of the given backend ("json" or "sqlite") for a board."""
+    backend = backend or getattr(config, "THREAD_STORE", "json")
+    if backend == "sqlite":
+        return SqliteThreadStore(board_path)
+    if backend == "json":
+        return JsonThreadStore(board_path)
+    raise ValueError(f"Unknown thread store {backend!r}. Use one of {', '.join(THREAD_STORES)}.")
+
+
+def get_thread_store(board_path):
+    """Returns the board's thread store selected by config.THREAD_STORE, shared within this process."""
+    key = (os.path.abspath(board_path), os.getpid())
+    with _stores_lock:
+        # SQLite connections must not cross a fork, so worker processes open their own store.
+        if key not in _stores:
+            _stores[key] = open_thread_store(board_path)
+        return _stores[key]
+
+
+def get_page_fingerprints(board_path):
+    """Returns the board's index of per-page fingerprints kept by step 2, shared within this process.
+
+    Each entry maps a thread's page numbers (as strings) to [fingerprint, time last verified].
+    """
+    key = (os.path.abspath(board_path), PAGE_FINGERPRINTS_NAME)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ThreadIndex(os.path.join(board_path, PAGE_FINGERPRINTS_NAME))
+        return _stores[key]
+
+
+def get_crawl_frontier(board_path):
+    """Returns the board's step 2 work queue, shared within this process.
+
+    Each entry holds a thread's crawl state ("pending", "in_progress", "done" or "failed"),
+    the CSV and mode of the run that queued it, its failed attempts, last error and the
+    time it may be retried.
+    """
+    key = (os.path.abspath(board_path), CRAWL_FRONTIER_NAME)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ThreadIndex(os.path.join(board_path, CRAWL_FRONTIER_NAME))
+        return _stores[key]
+
+
+def copy_threads(source, target):
+    """Copies every thread from one store to another. Returns the number of threads copied."""
+    copied = 0
+    for thread_id in source.iter_ids():
+        thread_data = source.load(thread_id)
+        if thread_data and thread_data.get("id"):
+            target.save(thread_data)
+            copied += 1
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Copy a board's threads between storage backends, e.g. export SQLite back to JSON files."
+    )
+    parser.add_argument("--board_id", type=int, default=config.BOARD_ID, help="The board ID.")
+    parser.add_argument("--source", type=str, required=True, choices=THREAD_STORES, help="Backend to read from.")
+    parser.add_argument("--target", type=str, required=True, choices=THREAD_STORES, help="Backend to write to.")
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        print("Source and target backends are the same. Nothing to do.")
+        return 1
+
+    board_path = get_board_path(args.board_id)
+    source = open_thread_store(board_path, args.source)
+    target = open_thread_store(board_path, args.target)
+    copied = copy_threads(source, target)
+    print(f"Copied {copied} threads from {source.location} to {target.location}.")
+    if args.target != getattr(config, "THREAD_STORE", "json"):
+        print(f"Set THREAD_STORE = \"{args.target}\" in config.py to use the copy in steps 2-4.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,176 @@
 # scraper/utils.py
 import hashlib
 import http.cookiejar
+import logging
 import os
 import re
+import threading
+import time
+from collections import Counter
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, FeatureNotFound
 
 # Assuming config is in the parent directory.
 # This is a bit of a hack to make it work when running scripts from the root directory.
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import config
+from scraper.http_cache import get_http_cache
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/104.0.0.0 Safari/537.36'
 }
 
 _session = None
+_session_lock = threading.Lock()
 _logged_in = False
+_login_lock = threading.RLock()
+_login_generation = 0
+_relogin_at = None  # When the login cookies are about to expire, if the server said.
+_session_stats = Counter()  # Logins, re-logins by reason and bad pages by kind, for the run summary.
+_session_stats_lock = threading.Lock()
+_rate_limiter = None
+_html_parser = None
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads to cap the global request rate."""
+
+    adaptive = False
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until the caller may send one request."""
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token even if it is not there yet, so waiting callers queue up in order.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_success(self, latency):
+        """Called after each throttled request that got an answer. Only AdaptiveRateLimiter uses it."""
+
+    def record_failure(self, reason):
+        """Called after a throttled request timed out, got a 5xx or a suspicious page."""
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """Token bucket whose rate follows the server's health (additive increase, multiplicative decrease).
+
+    Each answer faster than latency_target adds increase / rate, i.e. about increase requests
+    per second for every second of healthy traffic. A timeout, 5xx or suspicious page multiplies
+    the rate by decrease; failures within latency_target of the last cut were sent at the old
+    rate and do not cut it again.
+    """
+
+    adaptive = True
+
+    def __init__(self, rate, burst=1, min_rate=0.2, max_rate=10.0, increase=0.2, decrease=0.5,
+                 latency_target=2.0):
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        start = min(max(rate, self.min_rate), self.max_rate) if rate > 0 else self.max_rate
+        super().__init__(start, burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.lowest = self.highest = self.rate
+        self.failures = Counter()
+        self.slow = 0
+        self.cuts = 0
+        self._last_cut = float("-inf")
+
+    def _set_rate(self, rate):
+        # Called with the lock held. Settle the tokens earned at the old rate first.
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.lowest = min(self.lowest, self.rate)
+        self.highest = max(self.highest, self.rate)
+
+    def record_success(self, latency):
+        with self._lock:
+            if latency > self.latency_target:
+                self.slow += 1  # Hold the rate while the server is slow to answer.
+                return
+            self._set_rate(self.rate + self.increase / self.rate)
+
+    def record_failure(self, reason):
+        with self._lock:
+            self.failures[reason] += 1
+            now = time.monotonic()
+            if now - self._last_cut < self.latency_target:
+                return
+            self._last_cut = now
+            self.cuts += 1
+            self._set_rate(self.rate * self.decrease)
+            rate = self.rate
+        logging.info(f"Request rate lowered to {rate:.2f}/s after {reason}.")
+
+    def format_stats(self):
+        failures = ", ".join(f"{reason}={count}" for reason, count in sorted(self.failures.items()))
+        return (f"Request rate:           {self.rate:.2f}/s now, {self.lowest:.2f}-{self.highest:.2f}/s "
+                f"this run ({self.cuts} cuts; {failures or 'no failures'}; {self.slow} slow answers)")
+
+
+def get_rate_limiter():
+    """Returns the process-wide rate limiter for BBS requests."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        set_request_rate(
+            getattr(config, "REQUESTS_PER_SECOND", 1.0),
+            getattr(config, "REQUESTS_BURST", 1),
+        )
+    return _rate_limiter
+
+
+def set_request_rate(rate, burst=None):
+    """Replaces the process-wide rate limiter, e.g. from a command line option.
+
+    With config.ADAPTIVE_RATE, rate is where the adaptive limiter starts (0 starts at its maximum).
+    """
+    global _rate_limiter
+    if burst is None:
+        burst = getattr(config, "REQUESTS_BURST", 1)
+    if getattr(config, "ADAPTIVE_RATE", False):
+        _rate_limiter = AdaptiveRateLimiter(
+            rate, burst,
+            min_rate=getattr(config, "ADAPTIVE_RATE_MIN", 0.2),
+            max_rate=getattr(config, "ADAPTIVE_RATE_MAX", 10.0),
+            increase=getattr(config, "ADAPTIVE_RATE_INCREASE", 0.2),
+            decrease=getattr(config, "ADAPTIVE_RATE_DECREASE", 0.5),
+            latency_target=getattr(config, "ADAPTIVE_RATE_LATENCY", 2.0),
+        )
+    else:
+        _rate_limiter = RateLimiter(rate, burst)
+    return _rate_limiter
+
+
+def record_suspicious_page():
+    """Tells the rate limiter that the server answered with a broken or wrong page."""
+    get_rate_limiter().record_failure("suspicious page")
+
+
+def print_rate_stats():
+    limiter = get_rate_limiter()
+    if limiter.adaptive:
+        print(limiter.format_stats())
 
 
 def _load_dotenv(path=".env"):
@@ -35,11 +188,17 @@ def _load_dotenv(path=".env"):
 
 
 def _is_login_page(response):
-    return (
-        response.url.endswith("/login.php")
-        or 'id="page-login"' in response.text
-        or 'data-action="login"' in response.text
-    )
+    if response.url.endswith("/login.php"):
+        return True
+    # Don't pull a (possibly streamed) binary body into memory just to look for the login form.
+    if "html" not in response.headers.get("Content-Type", "text/html"):
+        return False
+    return is_login_page_text(response.text)
+
+
+def is_login_page_text(html):
+    """Checks whether a page is the login form, i.e. the session is no longer logged in."""
+    return 'id="page-login"' in html or 'data-action="login"' in html
 
 
 def _get_global_time(html):
@@ -53,11 +212,23 @@ def get_session():
     """Returns a shared requests session with persisted BBS cookies."""
     global _session
 
-    if _session is not None:
+    with _session_lock:
+        if _session is not None:
+            return _session
+        _session = _new_session()
         return _session
 
+
+def _new_session():
     session = requests.Session()
     session.headers.update(HEADERS)
+
+    # One bounded keep-alive pool shared by all worker threads; extra callers wait for a free connection.
+    pool_size = getattr(config, "HTTP_POOL_SIZE", 10)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
     cookie_file = getattr(config, "BBS_COOKIE_FILE", ".bbs_cookies")
     session.cookies = http.cookiejar.MozillaCookieJar(cookie_file)
     if os.path.exists(cookie_file):
@@ -65,22 +236,62 @@ def get_session():
             session.cookies.load(ignore_discard=True, ignore_expires=True)
         except http.cookiejar.LoadError:
             pass
+        if _login_generation == 0:
+            # Cookies from an earlier run: log in again before they run out rather than after.
+            _schedule_relogin(session.cookies, time.time())
+    return session
+
 
-    _session = session
-    return _session
+def _schedule_relogin(cookies, logged_in_at):
+    """Sets when to log in again, a margin before the first of the given cookies expires."""
+    global _relogin_at
+    expiries = [cookie.expires for cookie in cookies if cookie.expires]
+    if not expiries:
+        _relogin_at = None
+        return
+    lifetime = min(expiries) - logged_in_at
+    # Short-lived cookies are renewed half-way instead, so they don't trigger a login on every request.
+    _relogin_at = min(expiries) - min(getattr(config, "COOKIE_EXPIRY_MARGIN", 300), max(0, lifetime) / 2)
 
 
 def reset_session(clear_login=False):
-    """Drops the shared session so the next fetch starts fresh."""
+    """Drops the shared session, and with it its pooled connections, so the next fetch starts fresh.
+
+    The cookies are read back from the cookie file, so this does not log out; clear_login also
+    makes the next login() call log in again.
+    """
     global _session, _logged_in
-    _session = None
+    with _session_lock:
+        old_session, _session = _session, None
+    if old_session is not None:
+        # Closes the idle pooled connections now; ones still in use are closed as they are returned.
+        old_session.close()
+    count_session_event("connection reset")
     if clear_login:
-        _logged_in = False
+        with _login_lock:
+            _logged_in = False
+
+
+def count_session_event(event, amount=1):
+    with _session_stats_lock:
+        _session_stats[event] += amount
+
+
+def print_session_stats():
+    with _session_stats_lock:
+        stats = sorted(_session_stats.items())
+    if stats:
+        print(f"Session:                {', '.join(f'{event}={count}' for event, count in stats)}")
 
 
 def login(force=False):
     """Logs in to BBS with credentials from environment or .env."""
-    global _logged_in
+    with _login_lock:
+        return _login(force, "forced")
+
+
+def _login(force, reason):
+    global _logged_in, _login_generation
 
     _load_dotenv()
     username = os.environ.get("BBS_USERNAME")
@@ -115,7 +326,10 @@ def login(force=False):
     if not result.get("success"):
         raise RuntimeError(f"BBS login failed with error code {result.get('error')}.")
 
+    count_session_event("login" if _login_generation == 0 else f"re-login ({reason})")
     _logged_in = True
+    _login_generation += 1
+    _schedule_relogin(response.cookies, time.time())
     cookie_file = getattr(config, "BBS_COOKIE_FILE", ".bbs_cookies")
     try:
         session.cookies.save(cookie_file, ignore_discard=True, ignore_expires=True)
@@ -124,22 +338,138 @@ def login(force=False):
     return True
 
 
-def fetch(url, timeout=30, require_login=True, **kwargs):
-    """Fetches a URL, logging in and retrying once if BBS redirects to login."""
-    session = get_session()
-    response = session.get(url, timeout=timeout, **kwargs)
+def _relogin(seen_generation, reason="login page"):
+    """Logs in again, unless another thread already did so after seen_generation.
+
+    Many in-flight requests can hit the login page at once; only the first one
+    performs the login round-trip and the others reuse its cookies.
+    """
+    with _login_lock:
+        if _login_generation != seen_generation:
+            return True
+        return _login(True, reason)
+
+
+def fetch(url, timeout=30, require_login=True, throttle=True, method="GET", **kwargs):
+    """Fetches a URL, logging in and retrying once if BBS redirects to login.
+
+    If the login cookies are about to expire, it logs in again first.
+    Requests go through the shared rate limiter unless throttle is False.
+    """
+    generation = _login_generation
+    if require_login and _relogin_at is not None and time.time() >= _relogin_at:
+        _relogin(generation, "cookie expiry")
+        generation = _login_generation
+    response = _send(method, url, timeout, throttle, **kwargs)
     if require_login and _is_login_page(response):
-        login(force=True)
-        response = session.get(url, timeout=timeout, **kwargs)
-    response.raise_for_status()
+        response.close()
+        _relogin(generation)
+        response = _send(method, url, timeout, throttle, **kwargs)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        # A streamed response holds its pooled connection until closed, and the pool blocks when full.
+        response.close()
+        raise
     return response
 
 
-def get_soup(url, timeout=30):
-    """Fetches a URL and returns a BeautifulSoup object."""
+def _send(method, url, timeout, throttle, **kwargs):
+    """Sends one request, through the rate limiter if throttle is set, and reports how it went to it."""
+    limiter = get_rate_limiter() if throttle else None
+    if limiter:
+        limiter.acquire()
+    started = time.monotonic()
     try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.Timeout:
+        if limiter:
+            limiter.record_failure("timeout")
+        raise
+    except requests.exceptions.ConnectionError:
+        if limiter:
+            limiter.record_failure("connection error")
+        raise
+    if limiter:
+        if response.status_code >= 500 or response.status_code == 429:
+            limiter.record_failure(f"HTTP {response.status_code}")
+        else:
+            limiter.record_success(time.monotonic() - started)
+    return response
+
+
+def is_html_parser_available(parser):
+    """Checks whether BeautifulSoup can use the given tree builder, e.g. 'lxml'."""
+    try:
+        BeautifulSoup("", parser)
+    except FeatureNotFound:
+        return False
+    return True
+
+
+def get_html_parser():
+    """Returns the parser backend from config.HTML_PARSER, falling back to the pure-Python 'html.parser'."""
+    global _html_parser
+    if _html_parser is None:
+        parser = getattr(config, "HTML_PARSER", "html.parser")
+        if not is_html_parser_available(parser):
+            print(f"HTML parser '{parser}' is not installed. Falling back to 'html.parser'.")
+            parser = "html.parser"
+        _html_parser = parser
+    return _html_parser
+
+
+def make_soup(markup, parser=None):
+    """Parses HTML with the configured parser backend."""
+    return BeautifulSoup(markup, parser or get_html_parser())
+
+
+def fetch_page_text(url, timeout=30):
+    """Fetches an HTML page, going through the on-disk page cache if config.HTTP_CACHE is on."""
+    cache = get_http_cache()
+    if cache is None:
+        return fetch(url, timeout=timeout).text
+
+    entry = cache.get(url)
+    if entry and cache.is_fresh(entry):
+        text = cache.read_text(entry)
+        if text is not None:
+            cache.count("hit")
+            return text
+        entry = None
+
+    headers = cache.conditional_headers(entry) if entry else {}
+    response = fetch(url, timeout=timeout, headers=headers)
+    if response.status_code == 304 and entry:
+        text = cache.read_text(entry, refreshed=True)
+        if text is not None:
+            cache.count("revalidated")
+            return text
         response = fetch(url, timeout=timeout)
-        return BeautifulSoup(response.text, 'html.parser')
+
+    cache.count("miss")
+    if _is_login_page(response):
+        return response.text  # Never cache the login form in place of the page.
+    return cache.put(url, response)
+
+
+def invalidate_cached_page(url):
+    """Drops a page from the cache, so the next fetch goes to the server."""
+    cache = get_http_cache()
+    if cache is not None:
+        cache.invalidate(url)
+
+
+def print_http_cache_stats():
+    cache = get_http_cache()
+    if cache is not None:
+        print(cache.format_stats())
+
+
+def get_page_text(url, timeout=30):
+    """Fetches an HTML page and returns its text, or None if the request failed."""
+    try:
+        return fetch_page_text(url, timeout=timeout)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching {url}: {e}")
         return None
@@ -147,6 +477,25 @@ def get_soup(url, timeout=30):
         print(f"Error fetching {url}: {e}")
         return None
 
+
+def get_soup(url, timeout=30):
+    """Fetches a URL and returns a BeautifulSoup object."""
+    text = get_page_text(url, timeout=timeout)
+    return make_soup(text) if text is not None else None
+
+def get_total_pages(soup):
+    """Reads the total page count from a paging bar such as '/ 12'. Returns 1 if absent."""
+    total_pages = 1
+    if paging_div := soup.select_one("div.paging"):
+        total_pages_elem = paging_div.find(string=re.compile(r"/\s*\d+"))
+        if total_pages_elem:
+            try:
+                total_pages = int(total_pages_elem.strip().replace("/", "").strip())
+            except (ValueError, AttributeError):
+                pass
+    return total_pages
+
+
 def get_board_path(board_id):
     """Constructs and creates the main output path for a board."""
     board_folder_name = str(board_id)
@@ -154,6 +503,25 @@ def get_board_path(board_id):
     os.makedirs(path, exist_ok=True)
     return path
 
+def iter_board_ids(selected_ids=None):
+    """Returns the selected board IDs, or every board that has an output folder under OUTPUT_DIR."""
+    if selected_ids:
+        return [str(board_id) for board_id in selected_ids]
+
+    board_ids = []
+    for entry in sorted(os.listdir(config.OUTPUT_DIR)):
+        if entry.isdigit() and os.path.isdir(os.path.join(config.OUTPUT_DIR, entry)):
+            board_ids.append(entry)
+    return board_ids
+
+
+def parse_board_ids(raw_board_ids):
+    """Splits a comma-separated --board_ids value. Returns None if it is empty."""
+    if not raw_board_ids:
+        return None
+    return [board_id.strip() for board_id in raw_board_ids.split(",") if board_id.strip()]
+
+
 def sanitize_filename(filename):
     """Removes invalid characters from a filename."""
     return re.sub(r'[\\/*?:"<>|]', "", filename)
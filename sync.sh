@@ -10,7 +10,11 @@ date
 ./venv/bin/python3 -m scraper.step_1_index --board_id "$BOARD_ID" --mode $MODE || exit 1
 ./venv/bin/python3 -m scraper.step_2_thread --board_id "$BOARD_ID" --mode $MODE || exit 1
 ./venv/bin/python3 -m scraper.step_3_download_attachments --board_id "$BOARD_ID" --mode $MODE || exit 1
-./venv/bin/python3 -m scraper.step_4_render --board_id "$BOARD_ID" || exit 1
+./venv/bin/python3 -m scraper.step_4_render --board_id "$BOARD_ID" --mode $MODE || exit 1
+# Or, as one streaming run that passes each thread on as soon as it is crawled:
+# ./venv/bin/python3 -m scraper.pipeline --board_id "$BOARD_ID" --mode $MODE || exit 1
+# Or every board in config.BOARD_IDS with one login, instead of one cron line per board:
+# ./venv/bin/python3 -m scraper.run_boards --mode $MODE || exit 1
 
 # rsync -az --rsh=ssh --stats --checksum --delete --exclude='venv/' --exclude='.env' --exclude='.bbs_cookies' --exclude='**/.DS_Store' ./ ali:~/bbs_scraper/
 